@@ -0,0 +1,172 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+from metrics import ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+
+# Admission settings
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", 16))  # images processed at the same time
+MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", 64))  # requests waiting for a slot
+MAX_USER_REQUESTS = int(os.getenv("MAX_USER_REQUESTS", 4))  # processed and waiting requests of one user
+MAX_QUEUE_WAIT = float(os.getenv("MAX_QUEUE_WAIT", 10))  # seconds, longer waits are answered with 503
+
+
+class AdmissionController:
+    """Concurrency limiter for recognition requests with a bounded wait queue.
+
+    Waiting requests are grouped by user and slots are handed out round-robin
+    between users, so one user sending a burst does not delay everyone else.
+    Requests that cannot be admitted are rejected at once: 429 when the user
+    has too many requests, 503 when the queue is full or the wait is too long,
+    both with a Retry-After estimated from recent processing times.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_REQUESTS, max_queued=MAX_QUEUED_REQUESTS,
+                 max_per_user=MAX_USER_REQUESTS, max_wait=MAX_QUEUE_WAIT):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self.max_wait = max_wait
+
+        self.active = 0
+        self.queued = 0
+        self.user_requests = {}  # user_id -> processed and waiting requests
+        self.waiters = OrderedDict()  # user_id -> deque of futures, in round-robin order
+        self.service_time = 1.0  # seconds, moving average of time a slot is held
+
+        # metrics
+        self.admitted = 0
+        self.rejected_user = 0
+        self.rejected_full = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    def retry_after(self):
+        """Seconds until a slot is likely to be free."""
+        return max(1, math.ceil(self.service_time * (self.queued + 1) / self.max_concurrent))
+
+    def _reject(self, status_code, detail):
+        ADMISSION_REJECTED.labels(str(status_code)).inc()
+        raise HTTPException(
+            status_code=status_code, detail=detail, headers={"Retry-After": str(self.retry_after())}
+        )
+
+    async def acquire(self, user_id):
+        """Wait for a processing slot.
+
+        Returns:
+            float: perf_counter time the request was admitted, to be passed to release
+
+        Raises:
+            HTTPException: 429 or 503 if the request is not admitted
+        """
+        if self.user_requests.get(user_id, 0) >= self.max_per_user:
+            self.rejected_user += 1
+            self._reject(429, "Too many requests from this user")
+
+        t1 = time.perf_counter()
+        if self.active < self.max_concurrent and not self.waiters:
+            self.active += 1
+            self._count(user_id, 1)
+        else:
+            if self.queued >= self.max_queued:
+                self.rejected_full += 1
+                self._reject(503, "Server is overloaded")
+
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.setdefault(user_id, deque()).append(waiter)
+            self.queued += 1
+            self._count(user_id, 1)
+            try:
+                # release() moves the request from the queue to a slot
+                await asyncio.wait_for(waiter, self.max_wait)
+            except BaseException as e:
+                if waiter.done() and not waiter.cancelled():
+                    # the slot was handed over while the request was being cancelled
+                    self._release(user_id)
+                else:
+                    self._remove_waiter(user_id, waiter)
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timed_out += 1
+                    self._reject(503, "Server is overloaded")
+                raise
+
+        t2 = time.perf_counter()
+        self.admitted += 1
+        self.total_wait += t2 - t1
+        self.max_wait_seen = max(self.max_wait_seen, t2 - t1)
+        ADMISSION_WAIT_SECONDS.observe(t2 - t1)
+        return t2
+
+    def _count(self, user_id, delta):
+        count = self.user_requests.get(user_id, 0) + delta
+        if count:
+            self.user_requests[user_id] = count
+        else:
+            del self.user_requests[user_id]
+
+    def _remove_waiter(self, user_id, waiter):
+        queue = self.waiters.get(user_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self.waiters[user_id]
+        self.queued -= 1
+        self._count(user_id, -1)
+
+    def _release(self, user_id):
+        self._count(user_id, -1)
+        while self.waiters:
+            next_user, queue = next(iter(self.waiters.items()))
+            waiter = queue.popleft()
+            if queue:
+                self.waiters.move_to_end(next_user)
+            else:
+                del self.waiters[next_user]
+            if not waiter.done():
+                self.queued -= 1
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def release(self, user_id, admitted_at):
+        """Free the slot of a request, handing it to the next user in turn.
+
+        Args:
+            user_id: User the slot was acquired for
+            admitted_at: Value returned by acquire
+        """
+        self.service_time = 0.9 * self.service_time + 0.1 * (time.perf_counter() - admitted_at)
+        self._release(user_id)
+
+    @asynccontextmanager
+    async def slot(self, user_id):
+        """Hold a processing slot for the duration of the block."""
+        admitted_at = await self.acquire(user_id)
+        try:
+            yield
+        finally:
+            self.release(user_id, admitted_at)
+
+    def stats(self):
+        """Slot usage, rejections and queue wait times."""
+        return {
+            "active": self.active,
+            "max_concurrent": self.max_concurrent,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "admitted": self.admitted,
+            "rejected_user": self.rejected_user,
+            "rejected_full": self.rejected_full,
+            "timed_out": self.timed_out,
+            "mean_wait_ms": 1000 * self.total_wait / self.admitted if self.admitted else 0.0,
+            "max_wait_ms": 1000 * self.max_wait_seen,
+        }
+
+# Create a global admission controller instance
+admission = AdmissionController()
@@ -1,131 +1,552 @@
+import asyncio
+import hashlib
+import json
+import shutil
+import tarfile
+import tempfile
 import time
 import uuid
+import zipfile
 from contextlib import asynccontextmanager
 from datetime import datetime
 from io import BytesIO
 
-import cv2
 import numpy as np
-import tritonclient.http as httpclient
-from data_models import (PredictionResponse, SimpleResponse,
+from admission import admission
+from cache import result_cache
+from data_models import (BatchPredictionResponse, JobResponse,
+                         PredictionResponse, SimpleResponse,
                          TranscribationRequest, UpdateRequest)
-from database import db
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile
-from PIL import Image
-from utils import detection, misc, recognition
-
-client = httpclient.InferenceServerClient(url="triton-server:8000")
+from database import UpdateStatus, db
+from fastapi import FastAPI, File, Form, HTTPException, Query, UploadFile
+from fastapi.responses import Response, StreamingResponse
+from inference import (RECOGNITION_MAX_BATCH_SIZE, detection_batcher,
+                       recognition_batcher, triton)
+from jobs import JOB_MAX_WAIT, JOB_RETRY_AFTER, QueueFull, job_queue
+from metrics import (BOXES_PER_IMAGE, DROPPED_DETECTIONS,
+                     LOW_CONFIDENCE_IMPROVED, LOW_CONFIDENCE_RETRIES,
+                     REQUEST_SECONDS, STAGE_SECONDS)
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from utils import misc
+from workers import (SharedArray, cpu_pool, decode_batch, extract_crops,
+                     image_size, prepare_detection)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await db.connect()
+    await triton.connect()
+    await cpu_pool.start()
+    await job_queue.start(process_image)
     yield
     # Shutdown
+    await job_queue.close()
+    await detection_batcher.close()
+    await recognition_batcher.close()
+    await triton.close()
+    await cpu_pool.close()
     await db.close()
 
 app = FastAPI(lifespan=lifespan)
 
-@app.post("/predict")
-async def predict(user_id: str = Form(), request_id: str = Form(), file: UploadFile = File()):
-    
-    img_bytes: BytesIO = await file.read()
-    image = np.array(Image.open(BytesIO(img_bytes)))
+# crops are padded up to a multiple of this width, buckets of concurrent requests share batches
+RECOGNITION_WIDTH_STEP = 128
+# words below this confidence are recognized again from a contrast-adjusted crop, 0 disables the second pass
+LOW_CONFIDENCE_THRESHOLD = 0.1
+CONTRAST_TARGET = 0.4
+# words recognized with lower confidence are dropped from the result
+MIN_CONFIDENCE = 0.6
+# images of one /predict_batch call processed at the same time
+BATCH_CONCURRENCY = 16
+# limits of one /predict_batch call, members of archives count as images
+MAX_BATCH_FILES = 1000
+MAX_BATCH_BYTES = 512 * 1024 * 1024  # decompressed
+# uploads are copied to memory up to this size, to disk above it
+UPLOAD_SPOOL_SIZE = 1024 * 1024
 
-    t1 = time.time()
-    img_resized, target_ratio, _ = misc.resize_aspect_ratio(
-        image, 640, interpolation=cv2.INTER_LINEAR, mag_ratio=1.5
+async def recognize(crops, timings, on_batch=None):
+    """Recognize all crops in height and width bucketed batches.
+
+    Args:
+        crops: grayscale crops from misc.get_image_list, vertical ones are taller than model_height
+        timings: dict, recognition inference and decoding times are added to it
+        on_batch: optional coroutine function called with (indices, rows) as soon as a bucket is decoded
+
+    Returns:
+        list of [text, confidence] in the order of crops
+    """
+    result = [None] * len(crops)
+    batches = misc.batch_image_list(
+        crops, width_step=RECOGNITION_WIDTH_STEP, max_batch_size=RECOGNITION_MAX_BATCH_SIZE
     )
-    ratio_h = ratio_w = 1 / target_ratio
+    inferred_at = []
 
-    detector_input = misc.normalizeMeanVariance(img_resized)
-    detector_input = np.transpose(detector_input, (2, 0, 1))[None, ...]
+    async def run(indices, batch, widths):
+        preds = await recognition_batcher.submit(batch)
+        inferred_at.append(time.perf_counter())
+        # decode off the event loop, timesteps that only see the padding are dropped
+        lengths = np.ceil(preds.shape[1] * widths / batch.shape[-1]).astype(np.int32)
+        rows = await cpu_pool.run(decode_batch, preds, lengths)
+        for i, row in zip(indices, rows):
+            result[i] = row
+        if on_batch is not None:
+            await on_batch(indices, rows)
 
-    # http request to triton for detection model
-    infer_input = httpclient.InferInput("input", detector_input.shape, datatype="FP32")
-    infer_input.set_data_from_numpy(detector_input, binary_data=True)
+    # all buckets are in flight at once, each is decoded as soon as its output arrives
+    t1 = time.perf_counter()
+    await asyncio.gather(*[run(*batch) for batch in batches])
+    t3 = time.perf_counter()
+    t2 = max(inferred_at, default=t1)
+    timings["recognition_inference"] = timings.get("recognition_inference", 0.0) + t2 - t1
+    timings["recognition_decoding"] = timings.get("recognition_decoding", 0.0) + t3 - t2
+    return result
 
-    responce = client.infer(model_name="detection", inputs=[infer_input])
+def format_bbox(box):
+    # float32 precision is plenty for pixel coordinates
+    return [round(float(v), 1) for v in np.asarray(box, dtype=np.float32).ravel()]
 
-    maps = responce.as_numpy('output')
-    text_map = maps[0, :, :, 0]
-    link_map = maps[0, :, :, 1]
+async def run_pipeline(img_bytes, timings, progress=None):
+    """Detect and recognize words on an image.
 
+    Args:
+        img_bytes: Encoded image
+        timings: dict, filled with time in seconds spent in every stage
+        progress: optional coroutine function receiving partial result events,
+            "detections" once boxes are known and "words" as recognition batches complete
 
-    bboxes, _ = detection.getDetBoxes(
-        text_map, link_map, 
-        text_threshold=0.7, link_threshold=0.4, 
-        low_text=0.4, estimate_num_chars=None
-    )
+    Returns:
+        tuple: result dict (prediction, confidence, detections) and hash of decoded pixels
+    """
+    # only the header is parsed here, decoding happens in the cpu pool
+    width, height = image_size(img_bytes)
 
-    bboxes = detection.adjustResultCoordinates(bboxes, ratio_w, ratio_h)
-    
-    image_gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    image_gray = SharedArray((height, width), np.uint8)
+    try:
+        detector_input, target_ratio, pixel_hash, stage_timings = await cpu_pool.run(
+            prepare_detection, img_bytes, image_gray
+        )
+        timings.update(stage_timings)
 
-    result = []
-    for bbox in bboxes:
-        image_list = misc.get_image_list([bbox], image_gray, model_height=64)
+        # re-encoded copy of an image we already processed
+        cached = await result_cache.get("pixel_hash", pixel_hash)
+        if cached is not None:
+            return cached, pixel_hash
+        result_cache.record_miss()
 
-        coord = [item[0] for item in image_list]
-        img_list = [item[1][None, None, ...].astype(np.float32) / 255. for item in image_list]
+        try:
+            # http request to triton for detection model, batched with concurrent requests
+            t1 = time.perf_counter()
+            maps = await detection_batcher.submit(detector_input)
+            timings["detection_inference"] = time.perf_counter() - t1
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Detection model timed out")
 
-        # http request to triton to recognition model
-        infer_input = httpclient.InferInput("input1", img_list[0].shape, datatype="FP32")
-        infer_input.set_data_from_numpy(img_list[0], binary_data=True)
-        
-        responce = client.infer(model_name="recognition", inputs=[infer_input])
-        preds = responce.as_numpy('output')
+        image_list, stage_timings = await cpu_pool.run(extract_crops, maps, target_ratio, image_gray)
+        timings.update(stage_timings)
+    finally:
+        image_gray.unlink()
 
-        result1 = recognition.postprocess(preds)
-        low_confident_idx = [i for i,item in enumerate(result1) if (item[1] < 0.1)]
+    coord = [item[0] for item in image_list]
+    crops = [item[1] for item in image_list]
+    BOXES_PER_IMAGE.observe(len(crops))
+    if progress is not None:
+        await progress({"event": "detections", "boxes": [format_bbox(box) for box in coord]})
 
-        if len(low_confident_idx) > 0:
-            img_list2 = [img_list[i] for i in low_confident_idx]
+    async def report(indices, rows):
+        words = [
+            {"index": i, "text": text, "confidence": round(float(confidence), 4)}
+            for i, (text, confidence) in zip(indices, rows) if confidence >= MIN_CONFIDENCE
+        ]
+        if words:
+            await progress({"event": "words", "words": words})
 
-            infer_input = httpclient.InferInput("input1", img_list2[0].shape, datatype="FP32")
-            infer_input.set_data_from_numpy(img_list2[0], binary_data=True)
-            
-            responce = client.infer(model_name="recognition", inputs=[infer_input])
-            preds2 = responce.as_numpy('output')
-
-            result2 = recognition.postprocess(preds2)
-
-        for i, zipped in enumerate(zip(coord, result1)):
-            box, pred1 = zipped
-            if i in low_confident_idx:
-                pred2 = result2[low_confident_idx.index(i)]
-                if pred1[1]>pred2[1]:
-                    result.append((box, pred1[0], pred1[1]))
-                else:
-                    result.append((box, pred2[0], pred2[1]))
-            else:
-                result.append((box, pred1[0], pred1[1]))
-
-    result = [r for r in result if r[2] >= 0.6] #  remove unconfident detections
+    try:
+        result1 = await recognize(crops, timings, on_batch=report if progress is not None else None)
+
+        # second pass for low confident words, only for crops where contrast adjustment changes the input
+        retry_idx = [
+            i for i, item in enumerate(result1)
+            if item[1] < LOW_CONFIDENCE_THRESHOLD and misc.contrast_grey(crops[i])[0] < CONTRAST_TARGET
+        ]
+        if len(retry_idx) > 0:
+            LOW_CONFIDENCE_RETRIES.inc(len(retry_idx))
+
+            async def report_retry(indices, rows):
+                # only words the second pass improves, in positions of the original crops
+                improved = [
+                    (retry_idx[i], row) for i, row in zip(indices, rows)
+                    if row[1] >= result1[retry_idx[i]][1]
+                ]
+                if improved:
+                    await report(*zip(*improved))
+
+            result2 = await recognize(
+                [misc.adjust_contrast_grey(crops[i], target=CONTRAST_TARGET) for i in retry_idx],
+                timings,
+                on_batch=report_retry if progress is not None else None
+            )
+            for i, pred2 in zip(retry_idx, result2):
+                if pred2[1] >= result1[i][1]:
+                    result1[i] = pred2
+                    LOW_CONFIDENCE_IMPROVED.inc()
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Recognition model timed out")
+
+    result = [(box, pred[0], pred[1]) for box, pred in zip(coord, result1)]
+    result = [r for r in result if r[2] >= MIN_CONFIDENCE] #  remove unconfident detections
+    DROPPED_DETECTIONS.inc(len(coord) - len(result))
+
+    phrase = ' '.join(r[1] for r in result) if len(result) > 0 else ''
+    score = float(np.mean([r[2] for r in result])) if len(result) > 0 else 0.0
+    detections = [
+        {
+            "bbox": format_bbox(box),
+            "text": text,
+            "score": round(float(confidence), 4),
+        }
+        for box, text, confidence in result
+    ]
+    return {"prediction": phrase, "confidence": score, "detections": detections}, pixel_hash
+
+async def process_image(user_id, request_id, img_bytes, progress=None):
+    """Recognize an image, or take its result from the cache, and store the prediction.
+
+    Partial results are passed to progress, see run_pipeline. Cached results produce no partial events.
+
+    Returns:
+        dict: prediction, confidence and detections
+    """
+    t1 = time.time()
+    image_hash = hashlib.sha256(img_bytes).hexdigest()
+    pixel_hash = None
+    timings = {}
+    output = await result_cache.get("image_hash", image_hash)
+    if output is None:
+        output, pixel_hash = await run_pipeline(img_bytes, timings, progress)
+        result_cache.put([image_hash, pixel_hash], output)
     t2 = time.time()
-    # Store prediction in database
+
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.labels(stage).observe(seconds)
+    # the detector does not run for results found by either hash
+    REQUEST_SECONDS.labels(cached=str("detection_inference" not in timings).lower()).observe(t2 - t1)
+
+    # Store prediction in database, cached results too so that the request can be rated
     prediction_data = {
         "user_id": user_id,
         "request_id": request_id,
         "image_id": uuid.uuid4(),
         "created_at": datetime.now(),
-        "processing_time": t2 - t1,  # You can (probably) calculate this
-        "detections": [],  # Add your processed detections here
+        "processing_time": t2 - t1,
+        "timings": {stage: round(seconds, 5) for stage, seconds in timings.items()},
+        "image_hash": image_hash,
+        "prediction": output["prediction"],
+        "confidence": output["confidence"],
+        "detections": output["detections"],
         "user_rating": None,
         "user_transcription": None
     }
+    if pixel_hash is not None:
+        prediction_data["pixel_hash"] = pixel_hash
 
-    await db.insert_prediction(prediction_data)
+    await db.buffer_prediction(prediction_data)
+    return output
+
+@app.post("/predict")
+async def predict(user_id: str = Form(), request_id: str = Form(), file: UploadFile = File()):
+    
+    img_bytes: BytesIO = await file.read()
+    async with admission.slot(user_id):
+        output = await process_image(user_id, request_id, img_bytes)
 
-    phrase = ' '.join(r[1] for r in result) if len(result) > 0 else ''
-    score = float(np.mean([r[2] for r in result])) if len(result) > 0 else 0.0
     return PredictionResponse(
         request_id=request_id,
-        prediction=phrase,
-        confidence=score,
+        prediction=output["prediction"],
+        confidence=output["confidence"],
         status="ok"
     )
 
+async def progress_stream(user_id, request_id, img_bytes):
+    """Process an image, yield its partial results and then the final result as NDJSON lines."""
+    events = asyncio.Queue()
+
+    async def process():
+        try:
+            output = await process_image(user_id, request_id, img_bytes, progress=events.put)
+            await events.put({
+                "event": "result", "request_id": request_id, "status": "ok",
+                "prediction": output["prediction"], "confidence": output["confidence"],
+                "detections": output["detections"],
+            })
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            await events.put({"event": "result", "request_id": request_id, "status": "error", "detail": detail})
+        await events.put(None)
+
+    task = asyncio.create_task(process())
+    try:
+        while (event := await events.get()) is not None:
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+        await task
+    finally:
+        # client went away
+        task.cancel()
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """StreamingResponse holding an admission slot until it is sent.
+
+    The slot is released however sending ends, also when the body never
+    starts because the client disconnected first or the response start failed.
+    """
+
+    def __init__(self, content, user_id, admitted_at, **kwargs):
+        super().__init__(content, **kwargs)
+        self.user_id = user_id
+        self.admitted_at = admitted_at
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            admission.release(self.user_id, self.admitted_at)
+
+@app.post("/predict_stream")
+async def predict_progress(user_id: str = Form(), request_id: str = Form(), file: UploadFile = File()):
+    """Recognize an image, streaming partial results as NDJSON.
+
+    Emits a "detections" event with the boxes as soon as detection is done, then
+    "words" events with the `index` of the box, text and confidence as recognition
+    batches complete, a word can be sent again if the low confidence retry improves it.
+    The last event is "result" with the same content as /predict plus detections.
+    """
+    img_bytes = await file.read()
+    admitted_at = await admission.acquire(user_id)
+    return AdmittedStreamingResponse(
+        progress_stream(user_id, request_id, img_bytes), user_id, admitted_at, media_type="application/x-ndjson"
+    )
+
+def iter_members(filename, fileobj):
+    """Yield (name, size, read) of every image of an upload, zip and tar archives are unpacked.
+
+    read() returns the bytes of the image, it must be called before the next item is taken.
+    """
+    fileobj.seek(0)
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    # reads never return more than the declared file_size
+                    yield info.filename, info.file_size, lambda info=info: archive.read(info)
+        return
+
+    fileobj.seek(0)
+    if filename.endswith((".tar", ".tar.gz", ".tgz")):
+        with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, member.size, lambda member=member: archive.extractfile(member).read()
+        return
+
+    size = fileobj.seek(0, 2)
+    fileobj.seek(0)
+    yield filename, size, fileobj.read
+
+def spool_uploads(files):
+    """Copy the uploads into temporary files and check them against the batch limits.
+
+    The copies outlive the request, so the response can be streamed after the
+    endpoint returned, when the uploaded files may already be closed.
+    Runs in a thread, archives are listed by decompressing them.
+
+    Args:
+        files: list of UploadFile
+
+    Returns:
+        list of (filename, file) for iter_uploads, the caller closes the files
+    """
+    uploads = []
+    count = size = 0
+    try:
+        for file in files:
+            spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE)
+            uploads.append((file.filename or "", spool))
+            file.file.seek(0)
+            shutil.copyfileobj(file.file, spool)
+            for _, member_size, _ in iter_members(file.filename or "", spool):
+                count += 1
+                size += member_size
+                if count > MAX_BATCH_FILES:
+                    raise HTTPException(status_code=413, detail=f"More than {MAX_BATCH_FILES} images in the batch")
+                if size > MAX_BATCH_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Images of the batch exceed {MAX_BATCH_BYTES} bytes")
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        close_uploads(uploads)
+        raise HTTPException(status_code=400, detail=f"Broken archive: {e}")
+    except BaseException:
+        close_uploads(uploads)
+        raise
+    return uploads
+
+def close_uploads(uploads):
+    for _, fileobj in uploads:
+        fileobj.close()
+
+def iter_uploads(uploads):
+    """Yield (filename, bytes) of every image of the spooled uploads."""
+    for filename, fileobj in uploads:
+        for name, _, read in iter_members(filename, fileobj):
+            yield name, read()
+
+async def wait_for_admission(user_id):
+    """Acquire an admission slot for an image of a batch.
+
+    A batch cannot be answered with 429 or 503 once it streams, so its images
+    wait for the Retry-After of a rejection and ask again.
+
+    Returns:
+        float: admitted_at, to be passed to admission.release
+    """
+    while True:
+        try:
+            return await admission.acquire(user_id)
+        except HTTPException as e:
+            if e.status_code not in (429, 503):
+                raise
+            await asyncio.sleep(float(e.headers["Retry-After"]))
+
+async def predict_stream(user_id, uploads):
+    """Process spooled uploads concurrently, yield an NDJSON line per image as soon as it is done.
+
+    Every image holds an admission slot while it is processed, like a /predict
+    request of the same user. The uploads are closed when the stream ends.
+    """
+    results = asyncio.Queue()
+    # more would only be rejected by the per-user limit
+    slots = asyncio.Semaphore(min(BATCH_CONCURRENCY, admission.max_per_user))
+    tasks = set()
+
+    async def process(index, filename, img_bytes):
+        request_id = str(uuid.uuid4())
+        try:
+            admitted_at = await wait_for_admission(user_id)
+            try:
+                output = await process_image(user_id, request_id, img_bytes)
+            finally:
+                admission.release(user_id, admitted_at)
+            response = BatchPredictionResponse(
+                index=index, filename=filename, request_id=request_id,
+                prediction=output["prediction"], confidence=output["confidence"], status="ok"
+            )
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            response = BatchPredictionResponse(
+                index=index, filename=filename, request_id=request_id,
+                prediction=None, confidence=None, status="error", detail=detail
+            )
+        finally:
+            slots.release()
+        await results.put(response)
+
+    async def produce():
+        # only images holding one of the slots are read into memory,
+        # decompressing them would block the event loop
+        loop = asyncio.get_running_loop()
+        images = iter_uploads(uploads)
+        index = 0
+        while (image := await loop.run_in_executor(None, next, images, None)) is not None:
+            filename, img_bytes = image
+            await slots.acquire()
+            task = asyncio.create_task(process(index, filename, img_bytes))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            index += 1
+        if tasks:
+            await asyncio.gather(*tasks)
+        await results.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (response := await results.get()) is not None:
+            yield response.model_dump_json(exclude_none=True) + "\n"
+        await producer
+    finally:
+        # client went away
+        producer.cancel()
+        for task in list(tasks):
+            task.cancel()
+        close_uploads(uploads)
+
+@app.post("/predict_batch")
+async def predict_batch(user_id: str = Form(), files: list[UploadFile] = File()):
+    """Recognize many images, given as separate files and/or zip/tar archives.
+
+    Images are processed concurrently, so their detector inputs and crops share
+    triton batches. Results are streamed back as NDJSON in completion order,
+    `index` is the position of the image in the upload.
+    A batch holds at most MAX_BATCH_FILES images of MAX_BATCH_BYTES in total,
+    larger batches are answered with 413 and broken archives with 400.
+    """
+    uploads = await asyncio.get_running_loop().run_in_executor(None, spool_uploads, files)
+    return StreamingResponse(predict_stream(user_id, uploads), media_type="application/x-ndjson")
+
+def job_response(job):
+    return JobResponse(
+        job_id=job["job_id"],
+        request_id=job["request_id"],
+        status=job["status"],
+        prediction=job.get("prediction"),
+        confidence=job.get("confidence"),
+        detail=job.get("detail"),
+    )
+
+@app.post("/jobs", response_model=JobResponse, response_model_exclude_none=True, status_code=202)
+async def submit_job(user_id: str = Form(), file: UploadFile = File()):
+    """Queue an image for recognition and return at once.
+
+    The result is fetched from /jobs/{job_id}, its request_id rates the prediction.
+    Answers 503 with Retry-After when the job queue is full.
+    """
+    img_bytes = await file.read()
+    try:
+        job = await job_queue.submit(user_id, img_bytes)
+    except QueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many queued jobs",
+            headers={"Retry-After": str(JOB_RETRY_AFTER)}
+        )
+    return job_response(job)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse, response_model_exclude_none=True)
+async def get_job(job_id: str, wait: float = Query(0.0, ge=0, le=JOB_MAX_WAIT)):
+    """Status and result of a job.
+
+    Args:
+        job_id: Id returned by POST /jobs
+        wait: Seconds to wait for an unfinished job before answering (long-poll)
+    """
+    job = await job_queue.get(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job_response(job)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage latencies, triton calls, admission and result counters."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/stats")
+async def stats():
+    """Inference queue statistics."""
+    return {
+        "detection_batcher": detection_batcher.stats(),
+        "recognition_batcher": recognition_batcher.stats(),
+        "result_cache": result_cache.stats(),
+        "job_queue": job_queue.stats(),
+        "admission": admission.stats(),
+    }
+
 @app.post("/rate", response_model=SimpleResponse)
 async def update_rating(request: UpdateRequest):
     """Update the rating for a prediction.
@@ -137,27 +558,22 @@ async def update_rating(request: UpdateRequest):
         RatingUpdateResponse indicating success or failure
     """
     try:
-        # Check if prediction exists
-        prediction = await db.get_prediction(request.request_id)
-        if not prediction:
+        status = await db.update_rating(request.request_id, request.rating)
+        if status == UpdateStatus.NOT_FOUND:
             raise HTTPException(
                 status_code=404,
                 detail=f"Prediction with request_id {request.request_id} not found"
             )
-        
-        # Update the rating
-        success = await db.update_rating(request.request_id, request.rating)
-        
-        if success:
+
+        if status == UpdateStatus.UNCHANGED:
             return SimpleResponse(
                 success=True,
-                message="Rating updated successfully"
-            )
-        else:
-            return SimpleResponse(
-                success=False,
-                message="Failed to update rating"
+                message="Rating is already up to date"
             )
+        return SimpleResponse(
+            success=True,
+            message="Rating updated successfully"
+        )
             
     except HTTPException:
         raise
@@ -178,27 +594,22 @@ async def update_transcription(request: TranscribationRequest):
         TranscriptionUpdateResponse indicating success or failure
     """
     try:
-        # Check if prediction exists
-        prediction = await db.get_prediction(request.request_id)
-        if not prediction:
+        status = await db.update_transcription(request.request_id, request.transcription)
+        if status == UpdateStatus.NOT_FOUND:
             raise HTTPException(
                 status_code=404,
                 detail=f"Prediction with request_id {request.request_id} not found"
             )
-        
-        # Update the transcription
-        success = await db.update_transcription(request.request_id, request.transcription)
-        
-        if success:
+
+        if status == UpdateStatus.UNCHANGED:
             return SimpleResponse(
                 success=True,
-                message="Transcription updated successfully"
-            )
-        else:
-            return SimpleResponse(
-                success=False,
-                message="Failed to update transcription"
+                message="Transcription is already up to date"
             )
+        return SimpleResponse(
+            success=True,
+            message="Transcription updated successfully"
+        )
             
     except HTTPException:
         raise
@@ -0,0 +1,91 @@
+"""Compare CTC beam search throughput of the per-row decoder and the batched decoder.
+
+Run from app/backend: python -m benchmarks.beam_search [--rows 200]
+Record the regression corpus of tests/test_beam_search.py with --record tests/data/beam_search_corpus.npz
+"""
+import argparse
+import time
+
+import numpy as np
+from utils.recognition import converter, log_softmax
+
+from .reference_beam_search import ctcBeamSearch
+
+# peak logit of the true class over standard normal noise
+SHARPNESS = {"confident": 8.0, "medium": 4.0, "uncertain": 2.5}
+CORPUS_CHARACTER = 'abcdefghijklmnopqrstuvw'
+
+
+def beam_search_per_row(log_probs, lengths, classes, ignore_idx, beamWidth):
+    """Beam search as it was done before, one row of probabilities at a time."""
+    return [
+        ctcBeamSearch(np.exp(log_probs[i, :l]).astype(np.float64), classes, ignore_idx, beamWidth=beamWidth)
+        for i, l in enumerate(lengths)
+    ]
+
+def synthetic_logits(rows, max_length, num_classes, sharpness, seed=0):
+    """Logits shaped like recognizer output: a true class, often the blank, peaking over noise."""
+    rng = np.random.default_rng(seed)
+    logits = rng.normal(size=(rows, max_length, num_classes)).astype(np.float32)
+    index = rng.integers(1, min(num_classes, 40), (rows, max_length))
+    index[rng.random((rows, max_length)) < 0.5] = 0
+    np.put_along_axis(logits, index[..., None], sharpness, axis=2)
+    lengths = rng.integers(max_length // 4, max_length + 1, rows)
+    return logits, lengths
+
+def best_of(repeats, func, *args):
+    times = []
+    for _ in range(repeats):
+        t1 = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - t1)
+    return min(times), result
+
+def record(path, rows, max_length, beam_widths):
+    """Decode a small synthetic corpus with the per-row decoder and save it with its texts."""
+    classes = ['[blank]'] + list(CORPUS_CHARACTER)
+    corpus = {"logits": [], "lengths": [], "beam_widths": [], "texts": []}
+    for seed, sharpness in enumerate(SHARPNESS.values()):
+        logits, lengths = synthetic_logits(rows, max_length, len(classes), sharpness, seed)
+        logits = logits.astype(np.float16)
+        log_probs = log_softmax(logits.astype(np.float64), axis=2)
+        for beamWidth in beam_widths:
+            corpus["logits"].append(logits)
+            corpus["lengths"].append(lengths)
+            corpus["beam_widths"].append(np.full(rows, beamWidth))
+            corpus["texts"] += beam_search_per_row(log_probs, lengths, classes, [0], beamWidth)
+    np.savez_compressed(
+        path,
+        character=CORPUS_CHARACTER,
+        **{key: np.concatenate(value) if key != "texts" else np.array(value) for key, value in corpus.items()},
+    )
+    print(f"Recorded {len(corpus['texts'])} rows to {path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--length", type=int, default=40, help="timesteps per row")
+    parser.add_argument("--beam-widths", type=int, nargs="+", default=[5, 25])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--record", metavar="PATH", help="write the regression corpus instead of timing")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, rows=10, max_length=32, beam_widths=args.beam_widths)
+        raise SystemExit
+
+    print(f"{args.rows} rows of up to {args.length} timesteps, best of {args.repeats}")
+    for name, sharpness in SHARPNESS.items():
+        logits, lengths = synthetic_logits(args.rows, args.length, len(converter.character), sharpness)
+        log_probs = log_softmax(logits.astype(np.float64), axis=2)
+        for beamWidth in args.beam_widths:
+            old_time, old_texts = best_of(
+                args.repeats, beam_search_per_row, log_probs, lengths, converter.character, converter.ignore_idx, beamWidth
+            )
+            new_time, new_texts = best_of(args.repeats, converter.decode_beamsearch, log_probs, lengths, beamWidth)
+            mismatches = sum(a != b for a, b in zip(old_texts, new_texts))
+            print(
+                f"{name:>9} beam {beamWidth:2d}: per row {old_time * 1000:8.1f} ms, batched {new_time * 1000:8.1f} ms,"
+                f" speedup {old_time / new_time:5.1f}x, {mismatches} texts differ"
+            )
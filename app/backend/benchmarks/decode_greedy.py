@@ -0,0 +1,64 @@
+"""Compare greedy CTC decoding throughput of the per-row loop and the batched decoder.
+
+Run from app/backend: python -m benchmarks.decode_greedy [--rows 10000]
+"""
+import argparse
+import time
+
+import numpy as np
+from utils.recognition import converter
+
+
+def decode_greedy_per_row(text_index, length):
+    """Greedy decoding as it was done before, one row at a time."""
+    texts = []
+    index = 0
+    for l in length:
+        t = text_index[index:index + l]
+        a = np.insert(~((t[1:]==t[:-1])),0,True)
+        b = ~np.isin(t,np.array(converter.ignore_idx))
+        c = a & b
+        text = ''.join(np.array(converter.character)[t[c.nonzero()]])
+        texts.append(text)
+        index += l
+    return texts
+
+def synthetic_batch(rows, max_length, seed=0):
+    """Best indices shaped like recognizer output: runs of characters separated by blanks."""
+    rng = np.random.default_rng(seed)
+    index = rng.integers(1, len(converter.character), (rows, max_length))
+    index[rng.random((rows, max_length)) < 0.5] = 0
+    # characters and blanks spanning several timesteps
+    repeat = rng.random((rows, max_length)) < 0.4
+    repeat[:, 0] = False
+    index[:, 1:] = np.where(repeat[:, 1:], index[:, :-1], index[:, 1:])
+    lengths = rng.integers(max_length // 4, max_length + 1, rows)
+    return index, lengths
+
+def best_of(repeats, func, *args):
+    times = []
+    for _ in range(repeats):
+        t1 = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - t1)
+    return min(times), result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--length", type=int, default=64, help="timesteps per row")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    index, lengths = synthetic_batch(args.rows, args.length)
+    valid = np.arange(args.length)[None, :] < lengths[:, None]
+
+    old_time, old_texts = best_of(args.repeats, decode_greedy_per_row, index[valid], lengths)
+    new_time, new_texts = best_of(args.repeats, converter.decode_greedy, index, lengths)
+    assert old_texts == new_texts, "decoders disagree"
+
+    print(f"{args.rows} rows of up to {args.length} timesteps, best of {args.repeats}")
+    print(f"per row: {old_time * 1000:8.1f} ms {args.rows / old_time:12.0f} rows/s")
+    print(f"batched: {new_time * 1000:8.1f} ms {args.rows / new_time:12.0f} rows/s")
+    print(f"speedup: {old_time / new_time:.1f}x")
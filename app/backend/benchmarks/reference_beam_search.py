@@ -0,0 +1,182 @@
+"""The per-row CTC beam search the backend used before ctc_beam_search, kept as a reference.
+
+Copied from utils/converter.py without the language model and word list parts,
+it takes probabilities [T, C] of one row, not log probabilities.
+"""
+import numpy as np
+
+
+# code is based from https://github.com/githubharald/CTCDecoder/blob/master/src/BeamSearch.py
+class BeamEntry:
+    "information about one single beam at specific time-step"
+    def __init__(self):
+        self.prTotal = 0 # blank and non-blank
+        self.prNonBlank = 0 # non-blank
+        self.prBlank = 0 # blank
+        self.prText = 1 # LM score
+        self.labeling = () # beam-labeling
+        self.simplified = True  # To run simplyfiy label
+
+class BeamState:
+    "information about the beams at specific time-step"
+    def __init__(self):
+        self.entries = {}
+
+    def norm(self):
+        "length-normalise LM score"
+        for (k, _) in self.entries.items():
+            labelingLen = len(self.entries[k].labeling)
+            self.entries[k].prText = self.entries[k].prText ** (1.0 / (labelingLen if labelingLen else 1.0))
+
+    def sort(self):
+        "return beam-labelings, sorted by probability"
+        beams = [v for (_, v) in self.entries.items()]
+        sortedBeams = sorted(beams, reverse=True, key=lambda x: x.prTotal*x.prText)
+        return [x.labeling for x in sortedBeams]
+
+
+def simplify_label(labeling, blankIdx = 0):
+    labeling = np.array(labeling)
+
+    # collapse blank
+    idx = np.where(~((np.roll(labeling,1) == labeling) & (labeling == blankIdx)))[0]
+    labeling = labeling[idx]
+
+    # get rid of blank between different characters
+    idx = np.where( ~((np.roll(labeling,1) != np.roll(labeling,-1)) & (labeling == blankIdx)) )[0]
+
+    if len(labeling) > 0:
+        last_idx = len(labeling)-1
+        if last_idx not in idx: idx = np.append(idx, [last_idx])
+    labeling = labeling[idx]
+
+    return tuple(labeling)
+
+def fast_simplify_label(labeling, c, blankIdx=0):
+
+    # Adding BlankIDX after Non-Blank IDX
+    if labeling and c == blankIdx and labeling[-1] != blankIdx:
+        newLabeling = labeling + (c,)
+
+    # Case when a nonBlankChar is added after BlankChar |len(char) - 1
+    elif labeling and c != blankIdx and labeling[-1] == blankIdx:
+
+        # If Blank between same character do nothing | As done by Simplify label
+        if labeling[-2] == c:
+            newLabeling = labeling + (c,)
+
+        # if blank between different character, remove it | As done by Simplify Label
+        else:
+            newLabeling = labeling[:-1] + (c,)
+
+    # if consecutive blanks : Keep the original label
+    elif labeling and c == blankIdx and labeling[-1] == blankIdx:
+        newLabeling = labeling
+
+    # if empty beam & first index is blank
+    elif not labeling and c == blankIdx:
+        newLabeling = labeling
+
+    # if empty beam & first index is non-blank
+    elif not labeling and c != blankIdx:
+        newLabeling = labeling + (c,)
+
+    elif labeling and c != blankIdx:
+        newLabeling = labeling + (c,)
+
+    # Cases that might still require simplyfying
+    else:
+        newLabeling = labeling + (c,)
+        newLabeling = simplify_label(newLabeling, blankIdx)
+
+    return newLabeling
+
+def addBeam(beamState, labeling):
+    "add beam if it does not yet exist"
+    if labeling not in beamState.entries:
+        beamState.entries[labeling] = BeamEntry()
+
+def ctcBeamSearch(mat, classes, ignore_idx, beamWidth=25):
+    blankIdx = 0
+    maxT, maxC = mat.shape
+
+    # initialise beam state
+    last = BeamState()
+    labeling = ()
+    last.entries[labeling] = BeamEntry()
+    last.entries[labeling].prBlank = 1
+    last.entries[labeling].prTotal = 1
+
+    # go over all time-steps
+    for t in range(maxT):
+        curr = BeamState()
+        # get beam-labelings of best beams
+        bestLabelings = last.sort()[0:beamWidth]
+        # go over best beams
+        for labeling in bestLabelings:
+            # probability of paths ending with a non-blank
+            prNonBlank = 0
+            # in case of non-empty beam
+            if labeling:
+                # probability of paths with repeated last char at the end
+                prNonBlank = last.entries[labeling].prNonBlank * mat[t, labeling[-1]]
+
+            # probability of paths ending with a blank
+            prBlank = (last.entries[labeling].prTotal) * mat[t, blankIdx]
+
+            # add beam at current time-step if needed
+            prev_labeling = labeling
+            if not last.entries[labeling].simplified:
+                labeling = simplify_label(labeling, blankIdx)
+
+            # labeling = simplify_label(labeling, blankIdx)
+            addBeam(curr, labeling)
+
+            # fill in data
+            curr.entries[labeling].labeling = labeling
+            curr.entries[labeling].prNonBlank += prNonBlank
+            curr.entries[labeling].prBlank += prBlank
+            curr.entries[labeling].prTotal += prBlank + prNonBlank
+            curr.entries[labeling].prText = last.entries[prev_labeling].prText
+            # beam-labeling not changed, therefore also LM score unchanged from
+
+
+            # extend current beam-labeling
+            # char_highscore = np.argpartition(mat[t, :], -5)[-5:] # run through 5 highest probability
+            char_highscore = np.where(mat[t, :] >= 0.5/maxC)[0] # run through all probable characters
+            for c in char_highscore:
+            #for c in range(maxC - 1):
+                # add new char to current beam-labeling
+                # newLabeling = labeling + (c,)
+                # newLabeling = simplify_label(newLabeling, blankIdx)
+                newLabeling = fast_simplify_label(labeling, c, blankIdx)
+
+                # if new labeling contains duplicate char at the end, only consider paths ending with a blank
+                if labeling and labeling[-1] == c:
+                    prNonBlank = mat[t, c] * last.entries[prev_labeling].prBlank
+                else:
+                    prNonBlank = mat[t, c] * last.entries[prev_labeling].prTotal
+
+                # add beam at current time-step if needed
+                addBeam(curr, newLabeling)
+
+                # fill in data
+                curr.entries[newLabeling].labeling = newLabeling
+                curr.entries[newLabeling].prNonBlank += prNonBlank
+                curr.entries[newLabeling].prTotal += prNonBlank
+
+
+        # set new beam state
+
+        last = curr
+
+    # normalise LM scores according to beam-labeling-length
+    last.norm()
+
+    bestLabeling = last.sort()[0] # get most probable labeling
+    res = ''
+    for i,l in enumerate(bestLabeling):
+        # removing repeated characters and blank.
+        if l not in ignore_idx and (not (i > 0 and bestLabeling[i - 1] == bestLabeling[i])):
+            res += classes[l]
+    return res
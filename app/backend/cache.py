@@ -0,0 +1,110 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from database import db
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Result cache settings
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", 1024))  # entries kept in process
+CACHE_TTL = float(os.getenv("CACHE_TTL", 3600))  # seconds
+CACHE_USE_DB = os.getenv("CACHE_USE_DB", "0") == "1"  # fall back to stored predictions, a query per uncached image
+
+
+class ResultCache:
+    """LRU/TTL cache of recognition results keyed by image hashes.
+
+    A key is either the hash of the uploaded bytes (`image_hash`) or the hash
+    of the decoded pixels (`pixel_hash`), which also matches copies that were
+    re-encoded without changing pixels. Pixel hash misses in process can be
+    served from earlier documents of the predictions collection.
+
+    A request looks up its image_hash and then its pixel_hash, it is counted
+    once: as a hit by the lookup that found it, as a miss by record_miss.
+    """
+
+    def __init__(self, max_size=CACHE_MAX_SIZE, ttl=CACHE_TTL, use_db=CACHE_USE_DB):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.use_db = use_db
+        self.entries = OrderedDict()  # key -> (expires_at, result)
+
+        # metrics
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    async def get(self, field, key):
+        """Look a result up by hash.
+
+        Only pixel_hash lookups fall back to the database, identical bytes
+        always decode to identical pixels, so an image_hash query would only
+        repeat the pixel_hash one.
+
+        Args:
+            field: "image_hash" or "pixel_hash"
+            key: Hex digest
+
+        Returns:
+            dict: prediction, confidence and detections, or None on a miss
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return result
+            del self.entries[key]
+
+        if self.use_db and field == "pixel_hash":
+            try:
+                since = datetime.now() - timedelta(seconds=self.ttl)
+                document = await db.find_cached_prediction(field, key, since)
+            except Exception as e:
+                logger.warning(f"Result cache lookup in database failed: {e}")
+                document = None
+            if document is not None:
+                result = {
+                    "prediction": document["prediction"],
+                    "confidence": document["confidence"],
+                    "detections": document.get("detections", []),
+                }
+                self.put([key], result)
+                self.db_hits += 1
+                return result
+
+        return None
+
+    def record_miss(self):
+        """Count a request no lookup found, called once the last lookup failed."""
+        self.misses += 1
+
+    def put(self, keys, result):
+        """Store result under every key, evicting least recently used entries."""
+        expires_at = time.monotonic() + self.ttl
+        for key in keys:
+            self.entries[key] = (expires_at, result)
+            self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        """Hit/miss counters and current size."""
+        lookups = self.hits + self.db_hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.db_hits) / lookups if lookups else 0.0,
+        }
+
+# Create a global result cache instance
+result_cache = ResultCache()
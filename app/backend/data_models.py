@@ -7,6 +7,19 @@ class PredictionResponse(BaseModel):
     confidence: float | None
     status: str
 
+class BatchPredictionResponse(PredictionResponse):
+    index: int
+    filename: str
+    detail: str | None = None
+
+class JobResponse(BaseModel):
+    job_id: str
+    request_id: str
+    status: str
+    prediction: str | None = None
+    confidence: float | None = None
+    detail: str | None = None
+
 class UpdateRequest(BaseModel):
     request_id: str
     rating: int | None = Field(..., ge=1, le=5, description="Rating from 1 to 5")
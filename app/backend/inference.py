@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+
+import numpy as np
+import tritonclient.http as httpclient
+import tritonclient.http.aio as aiohttpclient
+from metrics import INFERENCE_BATCH_SIZE, INFERENCE_SECONDS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Triton connection settings
+TRITON_URL = os.getenv("TRITON_URL", "triton-server:8000")
+CONN_LIMIT = int(os.getenv("TRITON_CONN_LIMIT", 100))  # size of the aiohttp connection pool
+CONN_TIMEOUT = float(os.getenv("TRITON_CONN_TIMEOUT", 60.0))  # session-wide timeout, seconds
+INFER_TIMEOUT = float(os.getenv("TRITON_INFER_TIMEOUT", 10.0))  # per infer call, seconds
+
+# Detection micro-batching settings
+DETECTION_MAX_BATCH_SIZE = int(os.getenv("DETECTION_MAX_BATCH_SIZE", 8))
+DETECTION_MAX_WAIT_MS = float(os.getenv("DETECTION_MAX_WAIT_MS", 10.0))
+
+# Recognition micro-batching settings, crops of concurrent images share batches
+RECOGNITION_MAX_BATCH_SIZE = int(os.getenv("RECOGNITION_MAX_BATCH_SIZE", 32))
+RECOGNITION_MAX_WAIT_MS = float(os.getenv("RECOGNITION_MAX_WAIT_MS", 5.0))
+
+
+class InferenceClient:
+    def __init__(self):
+        self.client = None
+
+    async def connect(self):
+        """Create async triton client with connection pooling."""
+        if not self.client:
+            self.client = aiohttpclient.InferenceServerClient(
+                url=TRITON_URL,
+                conn_limit=CONN_LIMIT,
+                conn_timeout=CONN_TIMEOUT,
+            )
+            logger.info(f"Connected to Triton at {TRITON_URL} (pool size {CONN_LIMIT})")
+
+    async def close(self):
+        """Close triton client and its connection pool."""
+        if self.client:
+            await self.client.close()
+            self.client = None
+            logger.info("Closed Triton connection")
+
+    async def infer(self, model_name, input_name, data, output_name="output", timeout=INFER_TIMEOUT):
+        """Run a single FP32 input through a model without blocking the event loop.
+
+        Args:
+            model_name: Name of the model in the triton repository
+            input_name: Name of the model input
+            data: np.float32 array
+            output_name: Name of the model output
+            timeout: Seconds to wait for the response
+
+        Returns:
+            np.ndarray: Model output
+
+        Raises:
+            asyncio.TimeoutError: If triton did not answer in time
+        """
+        infer_input = httpclient.InferInput(input_name, data.shape, datatype="FP32")
+        infer_input.set_data_from_numpy(data, binary_data=True)
+        try:
+            responce = await asyncio.wait_for(
+                self.client.infer(model_name=model_name, inputs=[infer_input]),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"Inference of {model_name} timed out after {timeout}s")
+            raise
+        return responce.as_numpy(output_name)
+
+
+class BatchScheduler:
+    """Collects inputs of concurrent requests into batched inference calls.
+
+    Inputs are grouped by shape without the batch dimension, a group is sent
+    to triton once it holds max_batch_size rows, once the next input would
+    not fit, or once its oldest input waited max_wait_ms.
+    """
+
+    def __init__(self, client, model_name, input_name, max_batch_size, max_wait_ms):
+        self.client = client
+        self.model_name = model_name
+        self.input_name = input_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self.pending = {}  # input shape -> [(data, future, enqueued_at)]
+        self.pending_rows = {}  # input shape -> rows in pending
+        self.timers = {}
+        self.tasks = set()
+
+        # metrics
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.batch_sizes = Counter()
+        self.total_wait = 0.0
+
+    async def submit(self, data):
+        """Enqueue an input and wait for its output.
+
+        A batch never exceeds max_batch_size rows, inputs larger than that are split.
+
+        Args:
+            data: np.float32 array of shape [N, ...]
+
+        Returns:
+            np.ndarray: Model output rows for this input, batch dimension kept
+        """
+        if len(data) > self.max_batch_size:
+            parts = await asyncio.gather(*[
+                self.submit(data[start:start + self.max_batch_size])
+                for start in range(0, len(data), self.max_batch_size)
+            ])
+            return np.concatenate(parts)
+
+        future = asyncio.get_running_loop().create_future()
+        key = data.shape[1:]
+        if self.pending_rows.get(key, 0) + len(data) > self.max_batch_size:
+            # the group is sent as it is, the input starts the next one
+            self._flush(key)
+        pending = self.pending.setdefault(key, [])
+        pending.append((data, future, time.perf_counter()))
+        self.pending_rows[key] = self.pending_rows.get(key, 0) + len(data)
+
+        self.queue_depth += len(data)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+        if self.pending_rows[key] >= self.max_batch_size:
+            self._flush(key)
+        elif len(pending) == 1:
+            self.timers[key] = asyncio.get_running_loop().call_later(self.max_wait, self._flush, key)
+        return await future
+
+    def _flush(self, key):
+        timer = self.timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        items = self.pending.pop(key, [])
+        self.pending_rows.pop(key, None)
+        if items:
+            task = asyncio.create_task(self._run(items))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, items):
+        now = time.perf_counter()
+        batch = np.concatenate([data for data, _, _ in items])
+        self.queue_depth -= len(batch)
+        self.batch_sizes[len(batch)] += 1
+        self.total_wait += sum((now - enqueued_at) * len(data) for data, _, enqueued_at in items)
+        INFERENCE_BATCH_SIZE.labels(self.model_name).observe(len(batch))
+
+        try:
+            with INFERENCE_SECONDS.labels(self.model_name).time():
+                outputs = await self.client.infer(self.model_name, self.input_name, batch)
+        except Exception as e:
+            for _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        start = 0
+        for data, future, _ in items:
+            # caller may have been cancelled meanwhile
+            if not future.done():
+                future.set_result(outputs[start:start + len(data)])
+            start += len(data)
+
+    async def close(self):
+        """Send everything still queued and wait for in-flight batches."""
+        for key in list(self.pending):
+            self._flush(key)
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def stats(self):
+        """Queue depth and batch size statistics for tuning the batching window."""
+        batches = sum(self.batch_sizes.values())
+        rows = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "batches": batches,
+            "rows": rows,
+            "mean_batch_size": rows / batches if batches else 0.0,
+            "mean_wait_ms": 1000 * self.total_wait / rows if rows else 0.0,
+            "batch_sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+        }
+
+# Create a global inference client instance
+triton = InferenceClient()
+detection_batcher = BatchScheduler(
+    triton, "detection", "input",
+    max_batch_size=DETECTION_MAX_BATCH_SIZE,
+    max_wait_ms=DETECTION_MAX_WAIT_MS,
+)
+recognition_batcher = BatchScheduler(
+    triton, "recognition", "input1",
+    max_batch_size=RECOGNITION_MAX_BATCH_SIZE,
+    max_wait_ms=RECOGNITION_MAX_WAIT_MS,
+)
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from database import db
+from fastapi import HTTPException
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Job queue settings
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))  # jobs processed at the same time
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 100))  # submissions are rejected when this many jobs wait
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", 30))  # seconds, longest long-poll
+JOB_RETRY_AFTER = int(os.getenv("JOB_RETRY_AFTER", 5))  # seconds, suggested to rejected clients
+JOB_LEASE = float(os.getenv("JOB_LEASE", 60))  # seconds, unfinished jobs of a process that stopped renewing them are failed
+
+class QueueFull(Exception):
+    """Raised by submit when no more jobs can be accepted."""
+
+
+class JobQueue:
+    """Bounded queue of recognition jobs processed by a fixed set of workers.
+
+    Every job has a record in the jobs collection, so its status and result
+    survive the request that submitted it. The image itself is only kept in
+    memory, so the process renews a lease on its unfinished jobs while it runs.
+    Any process marks jobs whose lease ran out as failed, their owner is gone.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_size=JOB_QUEUE_SIZE):
+        self.num_workers = workers
+        self.max_size = max_size
+        # unique per process, sibling workers on one host and restarts never share it
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.process = None
+        self.heartbeat = None
+        self.queue = None
+        self.workers = []
+        self.finished = {}  # job_id -> event set when the job is finished, for long-polls
+
+        # metrics
+        self.accepted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.started = 0
+        self.failed = 0
+        self.total_wait = 0.0  # seconds jobs spent in the queue
+
+    async def start(self, process):
+        """Start the workers.
+
+        Args:
+            process: Coroutine function (user_id, request_id, img_bytes) returning the recognition result
+        """
+        if not self.workers:
+            await self._fail_expired()
+            self.process = process
+            self.queue = asyncio.Queue(maxsize=self.max_size)
+            self.workers = [asyncio.create_task(self._work()) for _ in range(self.num_workers)]
+            self.heartbeat = asyncio.create_task(self._renew_leases())
+            logger.info(f"Started {self.num_workers} job workers as {self.owner}")
+
+    async def close(self):
+        """Finish queued jobs and stop the workers."""
+        if self.workers:
+            for _ in self.workers:
+                await self.queue.put(None)
+            await asyncio.gather(*self.workers)
+            self.workers = []
+            self.heartbeat.cancel()
+            logger.info("Closed job queue")
+
+    async def submit(self, user_id, img_bytes):
+        """Record a job and queue it.
+
+        Returns:
+            dict: The job record
+
+        Raises:
+            QueueFull: if JOB_QUEUE_SIZE jobs are already waiting
+        """
+        if self.queue.full():
+            self.rejected += 1
+            raise QueueFull()
+
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "request_id": str(uuid.uuid4()),
+            "status": "queued",
+            "owner": self.owner,
+            "lease_until": datetime.now() + timedelta(seconds=JOB_LEASE),
+            "created_at": datetime.now(),
+        }
+        await db.insert_job(dict(job))
+        self.finished[job["job_id"]] = asyncio.Event()
+        try:
+            self.queue.put_nowait((job, img_bytes, time.perf_counter()))
+        except asyncio.QueueFull:
+            # filled up while the record was written
+            del self.finished[job["job_id"]]
+            self.rejected += 1
+            await db.update_job(job["job_id"], {
+                "status": "failed", "detail": "Job queue is full", "finished_at": datetime.now()
+            })
+            raise QueueFull()
+
+        self.accepted += 1
+        return job
+
+    async def get(self, job_id, wait=0.0):
+        """Get a job record, waiting up to `wait` seconds for it to finish.
+
+        Returns:
+            dict | None: The job record
+        """
+        event = self.finished.get(job_id)
+        if event is not None and wait > 0:
+            try:
+                await asyncio.wait_for(event.wait(), min(wait, JOB_MAX_WAIT))
+            except asyncio.TimeoutError:
+                pass
+        return await db.get_job(job_id)
+
+    async def _fail_expired(self):
+        interrupted = await db.fail_expired_jobs("Backend stopped before the job finished")
+        if interrupted:
+            logger.warning(f"Marked {interrupted} interrupted jobs as failed")
+
+    async def _renew_leases(self):
+        """Renew the leases of this process's jobs and fail the expired jobs of others."""
+        while True:
+            await asyncio.sleep(JOB_LEASE / 3)
+            try:
+                await db.renew_job_leases(self.owner, datetime.now() + timedelta(seconds=JOB_LEASE))
+                await self._fail_expired()
+            except Exception:
+                pass  # logged by the database, retried with the next renewal
+
+    async def _work(self):
+        while (item := await self.queue.get()) is not None:
+            job, img_bytes, queued_at = item
+            job_id = job["job_id"]
+            self.started += 1
+            self.total_wait += time.perf_counter() - queued_at
+            try:
+                await db.update_job(job_id, {"status": "running", "started_at": datetime.now()})
+                output = await self.process(job["user_id"], job["request_id"], img_bytes)
+                update = {
+                    "status": "done",
+                    "prediction": output["prediction"],
+                    "confidence": output["confidence"],
+                }
+                self.completed += 1
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                logger.error(f"Job {job_id} failed: {detail}")
+                update = {"status": "failed", "detail": detail}
+                self.failed += 1
+
+            update["finished_at"] = datetime.now()
+            try:
+                await db.update_job(job_id, update)
+            except Exception:
+                pass  # logged by the database
+            # waiters read the record themselves, the event is only needed until then
+            self.finished.pop(job_id).set()
+
+    def stats(self):
+        """Queue depth and job counters."""
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "max_queue_size": self.max_size,
+            "workers": self.num_workers,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "mean_wait_ms": 1000 * self.total_wait / self.started if self.started else 0.0,
+        }
+
+# Create a global job queue instance
+job_queue = JobQueue()
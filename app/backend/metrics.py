@@ -0,0 +1,65 @@
+from prometheus_client import Counter, Histogram
+
+# Prometheus metrics, exposed by /metrics. Stage timings are measured where
+# the stage runs (possibly in a pool worker) and observed in the server process.
+
+# seconds, from a fraction of a millisecond for small crops to slow triton calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_SECONDS = Histogram(
+    "ocr_stage_seconds",
+    "Time spent in a pipeline stage per image",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "ocr_request_seconds",
+    "Time to recognize an image, cached results included",
+    ["cached"],
+    buckets=LATENCY_BUCKETS,
+)
+INFERENCE_SECONDS = Histogram(
+    "ocr_triton_request_seconds",
+    "Duration of batched triton infer calls as seen by the backend",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+INFERENCE_BATCH_SIZE = Histogram(
+    "ocr_triton_batch_size",
+    "Rows per triton infer call",
+    ["model"],
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+DB_INSERT_SECONDS = Histogram(
+    "ocr_db_insert_seconds",
+    "Duration of batched prediction inserts",
+    buckets=LATENCY_BUCKETS,
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "ocr_admission_wait_seconds",
+    "Time admitted requests waited for a processing slot",
+    buckets=LATENCY_BUCKETS,
+)
+ADMISSION_REJECTED = Counter(
+    "ocr_admission_rejected_total",
+    "Requests rejected by admission control",
+    ["status"],
+)
+
+BOXES_PER_IMAGE = Histogram(
+    "ocr_boxes_per_image",
+    "Text boxes found by the detector per image",
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+LOW_CONFIDENCE_RETRIES = Counter(
+    "ocr_low_confidence_retries_total",
+    "Crops recognized again with adjusted contrast",
+)
+LOW_CONFIDENCE_IMPROVED = Counter(
+    "ocr_low_confidence_improved_total",
+    "Crops whose contrast adjusted recognition replaced the first result",
+)
+DROPPED_DETECTIONS = Counter(
+    "ocr_dropped_detections_total",
+    "Recognized boxes dropped for low confidence",
+)
@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+from utils.converter import ctc_beam_search, labeling_to_text
+from utils.language_model import CharNgramLM
+from utils.recognition import log_softmax
+
+# texts of the per-row decoder, recorded with python -m benchmarks.beam_search --record
+CORPUS = os.path.join(os.path.dirname(__file__), "data", "beam_search_corpus.npz")
+
+
+def test_matches_per_row_decoder():
+    corpus = np.load(CORPUS)
+    classes = ['[blank]'] + list(str(corpus["character"]))
+    log_probs = log_softmax(corpus["logits"].astype(np.float64), axis=2)
+
+    for beamWidth in np.unique(corpus["beam_widths"]):
+        rows = corpus["beam_widths"] == beamWidth
+        results = ctc_beam_search(log_probs[rows], corpus["lengths"][rows], beamWidth=int(beamWidth))
+        texts = [labeling_to_text(beams[0][0], classes, [0]) if beams else '' for beams in results]
+        assert texts == list(corpus["texts"][rows])
+
+def test_lm_bonus_offsets_length_penalty():
+    # a uniform language model only penalizes length, the second character is barely above the blank
+    classes = ['[blank]', 'a', 'b']
+    lm = CharNgramLM(np.full((3, 3, 3), np.log(0.5), dtype=np.float32))
+    log_probs = np.log(np.array([[
+        [0.1, 0.8, 0.1],
+        [0.4, 0.05, 0.55],
+    ]]))
+
+    def decode(lmBonus):
+        beams = ctc_beam_search(log_probs, beamWidth=5, lm=lm, lmWeight=1.0, lmBonus=lmBonus)[0]
+        return labeling_to_text(beams[0][0], classes, [0])
+
+    assert ctc_beam_search(log_probs, beamWidth=5)[0][0][0] == (1, 2)
+    assert decode(0.0) == 'a'
+    assert decode(-np.log(0.5)) == 'ab'
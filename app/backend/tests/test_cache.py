@@ -0,0 +1,57 @@
+import asyncio
+
+import cache
+import pytest
+from cache import ResultCache
+
+RESULT = {"prediction": "text", "confidence": 0.9, "detections": []}
+
+
+class FakeDatabase:
+    def __init__(self, documents=None):
+        self.documents = documents or {}  # (field, hash) -> document
+        self.queries = []
+
+    async def find_cached_prediction(self, field, value, since):
+        self.queries.append(field)
+        return self.documents.get((field, value))
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDatabase({("pixel_hash", "stored"): dict(RESULT)})
+    monkeypatch.setattr(cache, "db", db)
+    return db
+
+def test_db_fallback_is_off_by_default():
+    assert ResultCache().use_db is False
+
+def test_request_is_counted_once(fake_db):
+    result_cache = ResultCache(use_db=False)
+    result_cache.put(["pixels"], RESULT)
+
+    async def run():
+        # re-encoded copy: image_hash misses, pixel_hash hits
+        assert await result_cache.get("image_hash", "bytes") is None
+        assert await result_cache.get("pixel_hash", "pixels") == RESULT
+        # new image: both miss
+        assert await result_cache.get("image_hash", "new bytes") is None
+        assert await result_cache.get("pixel_hash", "new pixels") is None
+        result_cache.record_miss()
+
+    asyncio.run(run())
+    stats = result_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["hit_rate"] == 0.5
+
+def test_only_pixel_hash_queries_the_database(fake_db):
+    result_cache = ResultCache(use_db=True)
+
+    async def run():
+        assert await result_cache.get("image_hash", "bytes") is None
+        assert await result_cache.get("pixel_hash", "stored") == RESULT
+        # served in process afterwards
+        assert await result_cache.get("pixel_hash", "stored") == RESULT
+
+    asyncio.run(run())
+    assert fake_db.queries == ["pixel_hash"]
+    assert (result_cache.db_hits, result_cache.hits, result_cache.misses) == (1, 1, 0)
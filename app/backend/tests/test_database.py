@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import database
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+
+class FakePredictions:
+    """predictions collection with a unique request_id index."""
+
+    def __init__(self):
+        self.stored = {}  # request_id -> document
+        self.down = False
+        self.lose_reply = False  # store the documents but fail as if the reply was lost
+        self.calls = 0
+
+    async def insert_many(self, documents, ordered=False):
+        self.calls += 1
+        if self.down:
+            raise AutoReconnect("connection refused")
+        errors = []
+        for i, document in enumerate(documents):
+            document.setdefault("_id", ObjectId())
+            if document.get("invalid"):
+                errors.append({"index": i, "code": 121, "errmsg": "Document failed validation"})
+            elif document["request_id"] in self.stored:
+                errors.append({"index": i, "code": 11000, "errmsg": "E11000 duplicate key"})
+            else:
+                self.stored[document["request_id"]] = dict(document)
+        if self.lose_reply:
+            self.lose_reply = False
+            raise AutoReconnect("connection reset")
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    def find(self, query, projection=None):
+        async def documents():
+            for request_id in query["request_id"]["$in"]:
+                if request_id in self.stored:
+                    yield self.stored[request_id]
+        return documents()
+
+@pytest.fixture
+def fake_db():
+    db = database.Database()
+    db.db = SimpleNamespace(predictions=FakePredictions())
+    db.write_queue = asyncio.Queue()
+    db.flush_lock = asyncio.Lock()
+    db.flush_event = asyncio.Event()
+    return db
+
+def prediction(request_id, **fields):
+    return {"request_id": request_id, **fields}
+
+async def buffer(db, documents):
+    for document in documents:
+        await db.buffer_prediction(document)
+
+def test_permanent_errors_are_dropped(fake_db, caplog):
+    async def run():
+        await buffer(fake_db, [prediction("a"), prediction("b", invalid=True), prediction("c")])
+        await fake_db.flush()
+        await fake_db.flush()
+
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(run())
+    assert set(fake_db.db.predictions.stored) == {"a", "c"}
+    assert fake_db.failed == [] and fake_db.pending == {}
+    assert fake_db.db.predictions.calls == 1
+    assert "Dropped prediction b" in caplog.text
+
+def test_flush_keeps_draining_after_partial_failure(fake_db):
+    documents = [prediction(str(i), invalid=(i == 0)) for i in range(3 * database.WRITE_BATCH_SIZE)]
+
+    async def run():
+        await buffer(fake_db, documents)
+        await fake_db.flush()
+
+    asyncio.run(run())
+    assert len(fake_db.db.predictions.stored) == len(documents) - 1
+    assert fake_db.write_queue.empty()
+
+def test_unavailable_database_is_retried(fake_db):
+    async def run():
+        await buffer(fake_db, [prediction("a"), prediction("b")])
+        fake_db.db.predictions.down = True
+        await fake_db.flush()
+        assert len(fake_db.failed) == 2 and set(fake_db.pending) == {"a", "b"}
+        fake_db.db.predictions.down = False
+        await fake_db.flush()
+
+    asyncio.run(run())
+    assert set(fake_db.db.predictions.stored) == {"a", "b"}
+    assert fake_db.failed == [] and fake_db.pending == {}
+
+def test_duplicate_of_own_earlier_attempt_is_stored(fake_db, caplog):
+    async def run():
+        await buffer(fake_db, [prediction("a")])
+        fake_db.db.predictions.lose_reply = True
+        await fake_db.flush()
+        assert len(fake_db.failed) == 1
+        await fake_db.flush()
+
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(run())
+    assert fake_db.failed == [] and fake_db.pending == {}
+    assert "Dropped" not in caplog.text
+
+def test_reused_request_id_is_reported(fake_db, caplog):
+    async def run():
+        await buffer(fake_db, [prediction("a", prediction="first")])
+        await fake_db.flush()
+        await buffer(fake_db, [prediction("a", prediction="second")])
+        await fake_db.flush()
+
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(run())
+    assert fake_db.db.predictions.stored["a"]["prediction"] == "first"
+    assert fake_db.failed == []
+    assert "request_id already used" in caplog.text
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from benchmarks.reference_detection import getDetBoxes_core as getDetBoxes_core_full_map
+from utils.detection import getDetBoxes_core
+
+
+def gaussian(shape, center, sigma):
+    y, x = np.mgrid[:shape[0], :shape[1]]
+    return np.exp(-((x - center[0]) ** 2 + (y - center[1]) ** 2) / (2 * sigma ** 2))
+
+def synthetic_heatmaps(seed, shape=(160, 240), words=12):
+    """Region and affinity maps shaped like detector output.
+
+    Words are rows of character blobs at random angles, some cut by the border,
+    with links between neighbouring characters and a few specks of noise.
+    """
+    rng = np.random.default_rng(seed)
+    textmap = np.zeros(shape, dtype=np.float32)
+    linkmap = np.zeros(shape, dtype=np.float32)
+    for _ in range(words):
+        start = rng.uniform((-10, -10), (shape[1] + 10, shape[0] + 10))
+        angle = rng.uniform(-np.pi / 4, np.pi / 4)
+        step = rng.uniform(5, 10)
+        sigma = step / rng.uniform(2.5, 4)
+        peak = rng.uniform(0.5, 1.0)
+        direction = np.array([np.cos(angle), np.sin(angle)])
+        centers = [start + i * step * direction for i in range(rng.integers(1, 8))]
+        for center in centers:
+            textmap = np.maximum(textmap, peak * gaussian(shape, center, sigma))
+        for a, b in zip(centers[:-1], centers[1:]):
+            linkmap = np.maximum(linkmap, peak * gaussian(shape, (a + b) / 2, sigma * 0.7))
+    noise = rng.random(shape) < 0.002
+    textmap[noise] = np.maximum(textmap[noise], rng.uniform(0.3, 0.9, noise.sum()))
+    return textmap, linkmap
+
+
+@pytest.mark.parametrize("estimate_num_chars", [False, True])
+@pytest.mark.parametrize("seed", range(8))
+def test_matches_full_map_boxes(seed, estimate_num_chars):
+    textmap, linkmap = synthetic_heatmaps(seed)
+    args = (textmap, linkmap, 0.7, 0.4, 0.4, estimate_num_chars)
+
+    boxes, labels, mapper = getDetBoxes_core(*args)
+    expected_boxes, expected_labels, expected_mapper = getDetBoxes_core_full_map(*args)
+
+    assert len(expected_boxes) > 0
+    assert len(boxes) == len(expected_boxes)
+    for box, expected in zip(boxes, expected_boxes):
+        np.testing.assert_array_equal(box, expected)
+    np.testing.assert_array_equal(labels, expected_labels)
+    assert mapper == expected_mapper
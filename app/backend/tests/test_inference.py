@@ -0,0 +1,96 @@
+import asyncio
+
+import numpy as np
+from inference import BatchScheduler
+
+
+class StubClient:
+    """Triton client returning every input row times two, recording batch sizes."""
+
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.batches = []
+
+    async def infer(self, model_name, input_name, data):
+        self.batches.append(len(data))
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return data * 2
+
+def rows(count, start=0, width=3):
+    return np.arange(start, start + count * width, dtype=np.float32).reshape(count, width)
+
+def scheduler(client, max_batch_size=32, max_wait_ms=20.0):
+    return BatchScheduler(client, "model", "input", max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+def test_batches_never_exceed_max_batch_size():
+    client = StubClient()
+    batcher = scheduler(client)
+    first, second, large = rows(20), rows(31, start=1000), rows(70, start=5000)
+
+    async def run():
+        return await asyncio.gather(batcher.submit(first), batcher.submit(second), batcher.submit(large))
+
+    outputs = asyncio.run(run())
+    assert max(client.batches) <= 32
+    assert sum(client.batches) == 121
+    for data, output in zip((first, second, large), outputs):
+        np.testing.assert_array_equal(output, data * 2)
+
+def test_full_batch_is_sent_without_waiting():
+    client = StubClient()
+    # the timer would never fire within the test
+    batcher = scheduler(client, max_batch_size=4, max_wait_ms=60_000)
+
+    async def run():
+        return await asyncio.wait_for(asyncio.gather(batcher.submit(rows(2)), batcher.submit(rows(2, start=100))), 1.0)
+
+    first, second = asyncio.run(run())
+    assert client.batches == [4]
+    np.testing.assert_array_equal(first, rows(2) * 2)
+    np.testing.assert_array_equal(second, rows(2, start=100) * 2)
+
+def test_partial_batch_is_sent_after_max_wait():
+    client = StubClient()
+    batcher = scheduler(client, max_batch_size=32, max_wait_ms=20.0)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        output = await batcher.submit(rows(1))
+        return output, loop.time() - started
+
+    output, waited = asyncio.run(run())
+    assert client.batches == [1]
+    assert waited >= 0.02
+    np.testing.assert_array_equal(output, rows(1) * 2)
+
+def test_cancelled_caller_does_not_affect_the_batch():
+    client = StubClient(delay=0.05)
+    batcher = scheduler(client, max_batch_size=4)
+
+    async def run():
+        cancelled = asyncio.create_task(batcher.submit(rows(2)))
+        kept = asyncio.create_task(batcher.submit(rows(2, start=100)))
+        await asyncio.sleep(0.01)  # batch is in flight
+        cancelled.cancel()
+        output = await kept
+        await batcher.close()
+        return cancelled, output
+
+    cancelled, output = asyncio.run(run())
+    assert cancelled.cancelled()
+    assert client.batches == [4]
+    np.testing.assert_array_equal(output, rows(2, start=100) * 2)
+    assert batcher.stats()["queue_depth"] == 0
+
+def test_infer_error_reaches_every_caller():
+    error = RuntimeError("triton is down")
+    batcher = scheduler(StubClient(error=error), max_batch_size=8)
+
+    async def run():
+        return await asyncio.gather(*[batcher.submit(rows(2, start=i * 10)) for i in range(3)], return_exceptions=True)
+
+    assert asyncio.run(run()) == [error] * 3
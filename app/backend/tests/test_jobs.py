@@ -0,0 +1,95 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import database
+import jobs
+import pytest
+
+
+def matches(document, query):
+    """The subset of MongoDB queries used on the jobs collection."""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(document, option) for option in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = document.get(field)
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$lt" in condition and not (value is not None and value < condition["$lt"]):
+                return False
+            if "$exists" in condition and (field in document) != condition["$exists"]:
+                return False
+        elif document.get(field) != condition:
+            return False
+    return True
+
+class FakeJobs:
+    def __init__(self):
+        self.records = []
+
+    async def insert_one(self, document):
+        self.records.append(document)
+
+    async def update_one(self, query, update):
+        await self.update_many(query, update)
+
+    async def update_many(self, query, update):
+        matched = [record for record in self.records if matches(record, query)]
+        for record in matched:
+            record.update(update["$set"])
+        return SimpleNamespace(modified_count=len(matched))
+
+@pytest.fixture
+def fake_jobs(monkeypatch):
+    db = database.Database()
+    db.db = SimpleNamespace(jobs=FakeJobs())
+    monkeypatch.setattr(jobs, "db", db)
+    return db.db.jobs
+
+def job(job_id, owner, status="queued", lease=60):
+    record = {"job_id": job_id, "owner": owner, "status": status, "created_at": datetime.now()}
+    if lease is not None:
+        record["lease_until"] = datetime.now() + timedelta(seconds=lease)
+    return record
+
+async def never_finish(user_id, request_id, img_bytes):
+    await asyncio.sleep(3600)
+
+def test_owner_is_unique_per_process():
+    assert jobs.JobQueue().owner != jobs.JobQueue().owner
+
+def test_restart_keeps_running_jobs_of_siblings(fake_jobs):
+    fake_jobs.records = [
+        job("sibling", "host-1-a", status="running"),
+        job("crashed", "host-2-b", lease=-1),
+        job("legacy", "host", status="running", lease=None),
+    ]
+    queue = jobs.JobQueue(workers=1)
+
+    async def run():
+        await queue.start(never_finish)
+        await queue.close()
+
+    asyncio.run(run())
+    status = {record["job_id"]: record["status"] for record in fake_jobs.records}
+    assert status == {"sibling": "running", "crashed": "failed", "legacy": "failed"}
+
+def test_leases_are_renewed_while_running(fake_jobs, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_LEASE", 0.3)
+    queue = jobs.JobQueue(workers=1)
+
+    async def run():
+        await queue.start(never_finish)
+        submitted = await queue.submit("user", b"image")
+        # several leases long, a process that stopped renewing would have lost the job
+        await asyncio.sleep(1.0)
+        record = next(record for record in fake_jobs.records if record["job_id"] == submitted["job_id"])
+        assert record["status"] == "running"
+        assert record["lease_until"] > datetime.now()
+        queue.heartbeat.cancel()
+        for worker in queue.workers:
+            worker.cancel()
+
+    asyncio.run(run())
@@ -0,0 +1,78 @@
+import numpy as np
+from utils import lexicon as lexicon_module
+from utils.converter import ctc_beam_search, labeling_to_text
+from utils.lexicon import NO_NODE, ROOT, Lexicon, build_trie, encode_words
+
+CHARACTER = 'abc'  # index 0 is the blank
+
+
+def make_lexicon(words):
+    _, matrix, lengths = encode_words(words, CHARACTER)
+    return Lexicon(frozenset(words), *build_trie(matrix, lengths, len(CHARACTER) + 1), len(CHARACTER) + 1)
+
+def test_encode_words():
+    valid, matrix, lengths = encode_words(["ab", "", "ca", "xb", "b"], CHARACTER)
+
+    assert valid.tolist() == [True, False, True, False, True]
+    assert matrix.tolist() == [[1, 2], [3, 1], [2, -1]]
+    assert lengths.tolist() == [2, 2, 1]
+
+def test_build_trie():
+    _, matrix, lengths = encode_words(["ac", "b", "ab", "a", "ab"], CHARACTER)
+    edges, terminal = build_trie(matrix, lengths, 4)
+
+    # breadth first, children in character order: a, b, then ab, ac
+    assert edges.tolist() == [0 * 4 + 1, 0 * 4 + 2, 1 * 4 + 2, 1 * 4 + 3]
+    assert terminal.tolist() == [False, True, True, True, True]
+
+def test_child_and_is_word():
+    lexicon = make_lexicon(["ab", "ac", "b"])
+    a = lexicon.child(ROOT, 1)
+
+    assert lexicon.child(a, 2) != NO_NODE
+    assert lexicon.child(lexicon.child(ROOT, 2), 1) == NO_NODE
+    assert lexicon.child(ROOT, 3) == NO_NODE
+    # prefixes are not words unless they are listed
+    assert not lexicon.is_word(a)
+    assert lexicon.is_word(lexicon.child(a, np.array([2, 3]))).all()
+    assert "ab" in lexicon and "a" not in lexicon
+
+def test_beam_search_returns_words_only():
+    # "ac" is the most probable labeling, only "ab" is a word
+    log_probs = np.log(np.array([[
+        [0.1, 0.7, 0.1, 0.1],
+        [0.1, 0.1, 0.3, 0.5],
+    ]]))
+    lexicon = make_lexicon(["ab", "cc"])
+
+    assert ctc_beam_search(log_probs, beamWidth=5)[0][0][0] == (1, 3)
+    beams = ctc_beam_search(log_probs, beamWidth=5, topN=5, lexicon=lexicon)[0]
+    # "cc" would need a blank between its characters
+    assert [labeling for labeling, _ in beams] == [(1, 2)]
+
+def test_beam_search_prunes_non_prefixes():
+    # a single beam would follow "ac" and end without a word if it were not pruned
+    log_probs = np.log(np.array([[
+        [0.1, 0.7, 0.1, 0.1],
+        [0.1, 0.1, 0.3, 0.5],
+        [0.7, 0.1, 0.1, 0.1],
+    ]]))
+    lexicon = make_lexicon(["ab"])
+
+    beams = ctc_beam_search(log_probs, beamWidth=1, lexicon=lexicon)[0]
+    assert labeling_to_text(beams[0][0], ['[blank]'] + list(CHARACTER), [0]) == "ab"
+
+def test_trie_is_built_once(tmp_path, monkeypatch):
+    path = tmp_path / "words.txt"
+    path.write_text("ab\nac\nb\n", encoding="utf-8")
+    monkeypatch.setattr(lexicon_module, "LEXICON_CACHE_DIR", None)
+    first = Lexicon.load([str(path)], CHARACTER)
+
+    def encode_words(lines, character):
+        raise AssertionError("the cached trie is not used")
+
+    monkeypatch.setattr(lexicon_module, "encode_words", encode_words)
+    second = Lexicon.load([str(path)], CHARACTER)
+    assert second.words == first.words == {"ab", "ac", "b"}
+    np.testing.assert_array_equal(second.edges, first.edges)
+    np.testing.assert_array_equal(second.terminal, first.terminal)
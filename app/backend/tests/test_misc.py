@@ -0,0 +1,25 @@
+import cv2
+import numpy as np
+from utils import misc
+
+
+def test_batch_image_list_mixed_orientation():
+    image = np.full((400, 600), 255, dtype=np.uint8)
+    cv2.putText(image, "text", (20, 80), cv2.FONT_HERSHEY_SIMPLEX, 2, 0, 3)
+    boxes = [
+        [[10, 20], [210, 20], [210, 100], [10, 100]],  # horizontal word
+        [[300, 10], [340, 10], [340, 300], [300, 300]],  # vertical text, h > w
+        [[10, 150], [90, 150], [90, 190], [10, 190]],  # short horizontal word
+    ]
+    crops = [crop for _, crop in misc.get_image_list(boxes, image, model_height=64, sort_output=False)]
+    assert crops[1].shape[0] > 64 and crops[1].shape[1] == 64
+
+    batches = misc.batch_image_list(crops, width_step=128)
+
+    covered = sorted(i for indices, _, _ in batches for i in indices)
+    assert covered == [0, 1, 2]
+    for indices, batch, widths in batches:
+        assert {crops[i].shape[0] for i in indices} == {batch.shape[2]}
+        for row, i in enumerate(indices):
+            assert widths[row] == crops[i].shape[1]
+            assert np.allclose(batch[row, 0, :, :widths[row]], crops[i] / 255.)
@@ -0,0 +1,112 @@
+import asyncio
+import io
+import json
+import tarfile
+import zipfile
+
+import backend
+import pytest
+from admission import admission
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+
+
+def zip_bytes(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+def tar_bytes(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+@pytest.fixture
+def client(monkeypatch):
+    """Client of the app with a pipeline echoing the image bytes."""
+    async def process_image(user_id, request_id, img_bytes, progress=None):
+        return {"prediction": img_bytes.decode(), "confidence": 1.0}
+
+    monkeypatch.setattr(backend, "process_image", process_image)
+    return TestClient(backend.app)
+
+def post_batch(client, files):
+    return client.post("/predict_batch", data={"user_id": "user"}, files=[("files", file) for file in files])
+
+def test_images_and_archives(client):
+    response = post_batch(client, [
+        ("a.jpg", b"a"),
+        ("images.zip", zip_bytes({"b.jpg": b"b", "c.jpg": b"c"})),
+        ("images.tar.gz", tar_bytes({"d.jpg": b"d"})),
+    ])
+
+    assert response.status_code == 200
+    results = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda r: r["index"])
+    assert [(r["filename"], r["prediction"]) for r in results] == [
+        ("a.jpg", "a"), ("b.jpg", "b"), ("c.jpg", "c"), ("d.jpg", "d")
+    ]
+
+def test_spooled_uploads_outlive_upload_files():
+    files = [UploadFile(io.BytesIO(zip_bytes({"b.jpg": b"b"})), filename="images.zip")]
+    uploads = backend.spool_uploads(files)
+    files[0].file.close()
+
+    assert list(backend.iter_uploads(uploads)) == [("b.jpg", b"b")]
+    backend.close_uploads(uploads)
+
+def test_too_many_images(client, monkeypatch):
+    monkeypatch.setattr(backend, "MAX_BATCH_FILES", 2)
+    response = post_batch(client, [("a.jpg", b"a"), ("images.zip", zip_bytes({"b.jpg": b"b", "c.jpg": b"c"}))])
+    assert response.status_code == 413
+
+def test_too_many_decompressed_bytes(client, monkeypatch):
+    monkeypatch.setattr(backend, "MAX_BATCH_BYTES", 1000)
+    response = post_batch(client, [("images.tar.gz", tar_bytes({"b.jpg": b"0" * 1001}))])
+    assert response.status_code == 413
+
+def test_broken_archive(client):
+    response = post_batch(client, [("images.tar.gz", b"not a tar")])
+    assert response.status_code == 400
+
+def test_images_hold_admission_slots(client, monkeypatch):
+    monkeypatch.setattr(admission, "max_concurrent", 2)
+    monkeypatch.setattr(admission, "max_per_user", 8)
+    most = []
+
+    async def process_image(user_id, request_id, img_bytes, progress=None):
+        most.append(admission.active)
+        await asyncio.sleep(0.01)
+        return {"prediction": img_bytes.decode(), "confidence": 1.0}
+
+    monkeypatch.setattr(backend, "process_image", process_image)
+    response = post_batch(client, [(f"{i}.jpg", str(i).encode()) for i in range(6)])
+
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["status"] for r in results] == ["ok"] * 6
+    assert max(most) <= 2
+    assert admission.active == 0 and admission.user_requests == {}
+
+def test_rejected_images_wait_instead_of_failing(client, monkeypatch):
+    # the queue is full whenever another request holds the only slot
+    monkeypatch.setattr(admission, "max_concurrent", 1)
+    monkeypatch.setattr(admission, "max_queued", 0)
+
+    async def hold_slot():
+        async with admission.slot("other user"):
+            await asyncio.sleep(0.2)
+
+    async def run():
+        holder = asyncio.create_task(hold_slot())
+        await asyncio.sleep(0)
+        admitted_at = await backend.wait_for_admission("user")
+        admission.release("user", admitted_at)
+        await holder
+
+    asyncio.run(run())
+    assert admission.active == 0
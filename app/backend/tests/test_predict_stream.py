@@ -0,0 +1,101 @@
+import asyncio
+
+import backend
+import pytest
+from admission import admission
+
+BOUNDARY = "boundary"
+
+
+def multipart_body(user_id, request_id):
+    parts = [
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="user_id"\r\n\r\n{user_id}\r\n',
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="request_id"\r\n\r\n{request_id}\r\n',
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="a.jpg"\r\n'
+        'Content-Type: image/jpeg\r\n\r\nimage\r\n',
+        f'--{BOUNDARY}--\r\n',
+    ]
+    return "".join(parts).encode()
+
+async def post_predict_stream(send, user_id="user", request_id="request"):
+    """Call /predict_stream through ASGI with a custom send, the client disconnects after the request."""
+    body = multipart_body(user_id, request_id)
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)  # nothing more from the client until the app stops listening
+        return {"type": "http.disconnect"}
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/predict_stream", "raw_path": b"/predict_stream", "root_path": "",
+        "query_string": b"", "server": ("test", 80), "client": ("test", 1234),
+        "headers": [
+            (b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode()),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    }
+    await backend.app(scope, receive, send)
+
+@pytest.fixture
+def slow_pipeline(monkeypatch):
+    """process_image reporting detections and then never finishing."""
+    async def process_image(user_id, request_id, img_bytes, progress=None):
+        await progress({"event": "detections", "boxes": []})
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(backend, "process_image", process_image)
+
+def assert_released():
+    assert admission.active == 0
+    assert admission.queued == 0
+    assert admission.user_requests == {}
+
+def test_slot_released_when_response_start_fails(slow_pipeline):
+    async def send(message):
+        if message["type"] == "http.response.start":
+            raise OSError("client disconnected")
+
+    async def run():
+        with pytest.raises(OSError):
+            await post_predict_stream(send)
+
+    asyncio.run(run())
+    assert_released()
+
+def test_slot_released_when_stream_is_abandoned(slow_pipeline):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+        if message["type"] == "http.response.body" and message.get("body"):
+            raise OSError("client disconnected")
+
+    async def run():
+        try:
+            await post_predict_stream(send)
+        except Exception:
+            pass  # starlette reports the disconnect in its own way
+
+    asyncio.run(run())
+    assert sent[0]["type"] == "http.response.start"
+    assert_released()
+
+def test_abandoned_streams_do_not_exhaust_slots(slow_pipeline):
+    async def send(message):
+        raise OSError("client disconnected")
+
+    async def run():
+        for _ in range(admission.max_per_user + admission.max_concurrent):
+            try:
+                await post_predict_stream(send)
+            except Exception:
+                pass
+        assert_released()
+        # the user is still admitted afterwards
+        admitted_at = await admission.acquire("user")
+        admission.release("user", admitted_at)
+
+    asyncio.run(run())
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from utils.recognition import converter, postprocess
+
+NUM_CLASSES = len(converter.character)
+
+
+def logits(text, scale=10.0, seed=0):
+    """Logits spelling text with a blank after every character, over standard normal noise."""
+    rng = np.random.default_rng(seed)
+    index = [i for c in text for i in (converter.dict[c], 0)]
+    preds = rng.normal(size=(len(index), NUM_CLASSES)).astype(np.float32)
+    preds[np.arange(len(index)), index] = scale
+    return preds
+
+@pytest.mark.parametrize("decoder", ["greedy", "beamsearch"])
+def test_huge_logits(decoder):
+    preds = logits("AB12", scale=1e6)[None]
+
+    [[text, confidence]] = postprocess(preds, decoder=decoder)
+    assert text == "AB12"
+    assert not np.isnan(confidence)
+    assert 0.0 < confidence <= 1.0
+
+@pytest.mark.parametrize("decoder", ["greedy", "beamsearch"])
+def test_zero_length_rows(decoder):
+    preds = np.stack([logits("AB"), logits("CD", seed=1)])
+
+    results = postprocess(preds, lengths=[4, 0], decoder=decoder)
+    assert results[0][0] == "AB"
+    assert results[1] == ["", 0.0]
+
+@pytest.mark.parametrize("decoder", ["greedy", "beamsearch"])
+def test_padded_rows_match_unpadded(decoder):
+    short, long = logits("Ab", seed=1), logits("Cdef", seed=2)
+    # padding looks like text, it has to be ignored
+    padded = np.concatenate([short, logits("xyz", seed=3)[:len(long) - len(short)]])
+
+    batch = postprocess(np.stack([padded, long]), lengths=[len(short), len(long)], decoder=decoder)
+    assert batch == [postprocess(short[None], decoder=decoder)[0], postprocess(long[None], decoder=decoder)[0]]
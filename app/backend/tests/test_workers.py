@@ -0,0 +1,79 @@
+import asyncio
+import io
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+import workers
+from PIL import Image
+from workers import SharedArray, image_size, prepare_detection
+
+
+def encode(image, format="PNG", **params):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+def page(mode):
+    """White page with a dark bar, 60 wide and 40 high, in the given mode."""
+    rgb = Image.new("RGB", (60, 40), "white")
+    rgb.paste((20, 20, 20), (10, 10, 50, 20))
+    if mode == "P":
+        return rgb.convert("P", palette=Image.Palette.ADAPTIVE)
+    if mode in ("RGBA", "LA"):
+        # transparent page, opaque text
+        image = rgb.convert(mode)
+        alpha = Image.new("L", rgb.size, 0)
+        alpha.paste(255, (10, 10, 50, 20))
+        image.putalpha(alpha)
+        return image
+    return rgb.convert(mode)
+
+def run_prepare_detection(img_bytes):
+    width, height = image_size(img_bytes)
+    image_gray = SharedArray((height, width), np.uint8)
+    try:
+        detector_input, _, _, _ = prepare_detection(img_bytes, image_gray)
+        return detector_input, image_gray.array.copy()
+    finally:
+        image_gray.unlink()
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L", "LA", "P"])
+def test_decodes_every_mode(mode):
+    detector_input, gray = run_prepare_detection(encode(page(mode)))
+
+    assert detector_input.shape[:2] == (1, 3)
+    assert not np.isnan(detector_input).any()
+    assert gray.shape == (40, 60)
+    # text stays dark on a light page, also where the page was transparent
+    assert gray[15, 30] < 60
+    assert gray[30, 5] > 200
+
+def test_exif_orientation_is_applied():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90 degrees clockwise when displayed
+    img_bytes = encode(page("RGB"), format="JPEG", exif=exif)
+
+    assert image_size(img_bytes) == (40, 60)
+    _, gray = run_prepare_detection(img_bytes)
+    assert gray.shape == (60, 40)
+    # the horizontal bar is vertical once upright
+    assert gray[30, 40 - 15] < 60
+
+def test_broken_process_pool_is_replaced(monkeypatch):
+    monkeypatch.setattr(workers, "CPU_EXECUTOR", "process")
+    monkeypatch.setattr(workers, "CPU_WORKERS", 1)
+    pool = workers.CPUPool()
+
+    async def run():
+        await pool.start()
+        try:
+            # the worker dies on every attempt, as on SIGBUS
+            with pytest.raises(BrokenProcessPool):
+                await pool.run(os._exit, 1)
+            assert await pool.run(abs, -3) == 3
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
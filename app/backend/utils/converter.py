@@ -1,5 +1,10 @@
+from functools import cached_property
+
 import numpy as np
 
+from .language_model import START, CharNgramLM
+from .lexicon import NO_NODE, ROOT, Lexicon
+
 
 def consecutive(data, mode ='first', stepsize=1):
     group = np.split(data, np.where(np.diff(data) != stepsize)[0]+1)
@@ -40,224 +45,253 @@ def word_segmentation(mat, separator_idx =  {'th': [1,2],'en': [3,4]}, separator
         result.append( ['', [start_idx, len(mat)-1] ] )
     return result
 
-# code is based from https://github.com/githubharald/CTCDecoder/blob/master/src/BeamSearch.py
-class BeamEntry:
-    "information about one single beam at specific time-step"
-    def __init__(self):
-        self.prTotal = 0 # blank and non-blank
-        self.prNonBlank = 0 # non-blank
-        self.prBlank = 0 # blank
-        self.prText = 1 # LM score
-        self.lmApplied = False # flag if LM was already applied to this beam
-        self.labeling = () # beam-labeling
-        self.simplified = True  # To run simplyfiy label
-
-class BeamState:
-    "information about the beams at specific time-step"
-    def __init__(self):
-        self.entries = {}
-
-    def norm(self):
-        "length-normalise LM score"
-        for (k, _) in self.entries.items():
-            labelingLen = len(self.entries[k].labeling)
-            self.entries[k].prText = self.entries[k].prText ** (1.0 / (labelingLen if labelingLen else 1.0))
-
-    def sort(self):
-        "return beam-labelings, sorted by probability"
-        beams = [v for (_, v) in self.entries.items()]
-        sortedBeams = sorted(beams, reverse=True, key=lambda x: x.prTotal*x.prText)
-        return [x.labeling for x in sortedBeams]
-
-    def wordsearch(self, classes, ignore_idx, maxCandidate, dict_list):
-        beams = [v for (_, v) in self.entries.items()]
-        sortedBeams = sorted(beams, reverse=True, key=lambda x: x.prTotal*x.prText)
-        if len(sortedBeams) >  maxCandidate: sortedBeams = sortedBeams[:maxCandidate]
-
-        for j, candidate in enumerate(sortedBeams):
-            idx_list = candidate.labeling
-            text = ''
-            for i,l in enumerate(idx_list):
-                if l not in ignore_idx and (not (i > 0 and idx_list[i - 1] == idx_list[i])):
-                    text += classes[l]
-
-            if j == 0: best_text = text
-            if text in dict_list:
-                #print('found text: ', text)
-                best_text = text
-                break
-            else:
-                pass
-                #print('not in dict: ', text)
-        return best_text
-
-def applyLM(parentBeam, childBeam, classes, lm):
-    "calculate LM score of child beam by taking score from parent beam and bigram probability of last two chars"
-    if lm and not childBeam.lmApplied:
-        c1 = classes[parentBeam.labeling[-1] if parentBeam.labeling else classes.index(' ')] # first char
-        c2 = classes[childBeam.labeling[-1]] # second char
-        lmFactor = 0.01 # influence of language model
-        bigramProb = lm.getCharBigram(c1, c2) ** lmFactor # probability of seeing first and second char next to each other
-        childBeam.prText = parentBeam.prText * bigramProb # probability of char sequence
-        childBeam.lmApplied = True # only apply LM once per beam entry
-
-def simplify_label(labeling, blankIdx = 0):
-    labeling = np.array(labeling)
-
-    # collapse blank
-    idx = np.where(~((np.roll(labeling,1) == labeling) & (labeling == blankIdx)))[0]
-    labeling = labeling[idx]
-
-    # get rid of blank between different characters
-    idx = np.where( ~((np.roll(labeling,1) != np.roll(labeling,-1)) & (labeling == blankIdx)) )[0]
-
-    if len(labeling) > 0:
-        last_idx = len(labeling)-1
-        if last_idx not in idx: idx = np.append(idx, [last_idx])
-    labeling = labeling[idx]
-
-    return tuple(labeling)
-
-def fast_simplify_label(labeling, c, blankIdx=0):
-
-    # Adding BlankIDX after Non-Blank IDX
-    if labeling and c == blankIdx and labeling[-1] != blankIdx:
-        newLabeling = labeling + (c,)
-
-    # Case when a nonBlankChar is added after BlankChar |len(char) - 1
-    elif labeling and c != blankIdx and labeling[-1] == blankIdx:
-
-        # If Blank between same character do nothing | As done by Simplify label
-        if labeling[-2] == c:
-            newLabeling = labeling + (c,)
-
-        # if blank between different character, remove it | As done by Simplify Label
-        else:
-            newLabeling = labeling[:-1] + (c,)
-
-    # if consecutive blanks : Keep the original label
-    elif labeling and c == blankIdx and labeling[-1] == blankIdx:
-        newLabeling = labeling
-
-    # if empty beam & first index is blank
-    elif not labeling and c == blankIdx:
-        newLabeling = labeling
-
-    # if empty beam & first index is non-blank
-    elif not labeling and c != blankIdx:
-        newLabeling = labeling + (c,)
-
-    elif labeling and c != blankIdx:
-        newLabeling = labeling + (c,)
+# Beam search over hashed prefixes, all beams of all rows are updated with array operations.
+# Beam semantics follow https://github.com/githubharald/CTCDecoder/blob/master/src/BeamSearch.py
+# as adapted by EasyOCR: a labeling keeps a blank between repeated characters
+# and a trailing blank, e.g. (a, 0) and (a, 0, a).
+
+HASH_MULTIPLIER = np.uint64(0x100000001B3)
+EMPTY = -1  # "last" and "prev" of a labeling too short to have them
+MAX_WORD_CANDIDATES = 20  # best labelings looked up in the word list
+TOP_K_SORT_WIDTH = 100  # candidates per row up to which sorting them all is faster than partitioning
+
+
+def prefix_hash(keys, chars):
+    "hash of labelings extended by one character"
+    return keys * HASH_MULTIPLIER + chars.astype(np.uint64) + np.uint64(1)
+
+def top_k(scores, k):
+    "indices of the k highest scores of every row, highest first, ties go to the earliest"
+    if scores.shape[1] <= max(k, TOP_K_SORT_WIDTH):
+        return np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    # everything above the k-th highest score, then the earliest scores equal to it
+    kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1, None]
+    above = scores > kth
+    tied = scores == kth
+    tied &= np.cumsum(tied, axis=1) <= k - above.sum(axis=1, keepdims=True)
+    best = np.nonzero(above | tied)[1].reshape(len(scores), k)
+    return np.take_along_axis(best, np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1, kind='stable'), axis=1)
+
+def ctc_beam_search(log_probs, lengths=None, beamWidth=25, topN=1, blankIdx=0, charWidth=None, lexicon=None, lm=None, lmWeight=0.5, lmBonus=0.0):
+    """CTC beam search over a batch.
+
+    Args:
+        log_probs: [B, T, C] log probabilities
+        lengths: [B] valid timesteps of every row, all T by default
+        beamWidth: beams kept per row after every timestep
+        topN: labelings returned per row
+        blankIdx: index of the CTC blank
+        charWidth: extend beams only by this many most probable characters per timestep,
+            all characters above 0.5 / C by default
+        lexicon: Lexicon, keep only labelings spelling a prefix of one of its words
+            and return only whole words
+        lm: CharNgramLM, add lmWeight * log P(char | previous two characters) for every character of a labeling
+        lmWeight: weight of the language model score
+        lmBonus: added for every character the language model scores. Its log probabilities
+            are negative, without a bonus the search prefers short labelings that drop characters.
+            About lmWeight times the mean -log P(char | context) of real text balances them.
+
+    Returns:
+        list per row of up to topN (labeling, log probability) pairs, best first
+    """
+    B, maxT, maxC = log_probs.shape
+    if lengths is None:
+        lengths = np.full(B, maxT)
+    lengths = np.asarray(lengths)
+    K = max(beamWidth, topN)  # the last timestep of a row keeps topN candidates
+    threshold = np.log(0.5 / maxC)  # characters less probable than this do not extend beams
+
+    # beams of every row, a row starts with the empty labeling only
+    keys = np.zeros((B, K, 2), dtype=np.uint64)  # labeling, labeling without its last element
+    labels = np.full((B, K, 5), EMPTY)  # last element, element before it, node, lexicon trie node, lm context
+    labels[..., 3] = ROOT
+    labels[..., 4] = START
+    probs = np.full((B, K, 3), -np.inf)  # log prNonBlank, log prBlank, weighted lm log probability
+    probs[:, 0, 1] = 0.0
+    probs[..., 2] = 0.0
+
+    # labelings as linked lists, node -> (parent node, char)
+    node_parent = np.empty(B * K * maxT + 1, dtype=np.int64)
+    node_char = np.empty(B * K * maxT + 1, dtype=np.int64)
+    num_nodes = 0
+
+    # equal labelings of different rows must not be merged
+    row_salt = np.arange(B, dtype=np.uint64)[:, None, None] * np.uint64(0x9E3779B97F4A7C15)
 
-    # Cases that might still require simplyfying
-    else:
-        newLabeling = labeling + (c,)
-        newLabeling = simplify_label(newLabeling, blankIdx)
-
-    return newLabeling
-
-def addBeam(beamState, labeling):
-    "add beam if it does not yet exist"
-    if labeling not in beamState.entries:
-        beamState.entries[labeling] = BeamEntry()
-
-def ctcBeamSearch(mat, classes, ignore_idx, lm, beamWidth=25, dict_list = []):
-    blankIdx = 0
-    maxT, maxC = mat.shape
-
-    # initialise beam state
-    last = BeamState()
-    labeling = ()
-    last.entries[labeling] = BeamEntry()
-    last.entries[labeling].prBlank = 1
-    last.entries[labeling].prTotal = 1
-
-    # go over all time-steps
     for t in range(maxT):
-        curr = BeamState()
-        # get beam-labelings of best beams
-        bestLabelings = last.sort()[0:beamWidth]
-        # go over best beams
-        for labeling in bestLabelings:
-            # probability of paths ending with a non-blank
-            prNonBlank = 0
-            # in case of non-empty beam
-            if labeling:
-                # probability of paths with repeated last char at the end
-                prNonBlank = last.entries[labeling].prNonBlank * mat[t, labeling[-1]]
-
-            # probability of paths ending with a blank
-            prBlank = (last.entries[labeling].prTotal) * mat[t, blankIdx]
-
-            # add beam at current time-step if needed
-            prev_labeling = labeling
-            if not last.entries[labeling].simplified:
-                labeling = simplify_label(labeling, blankIdx)
-
-            # labeling = simplify_label(labeling, blankIdx)
-            addBeam(curr, labeling)
-
-            # fill in data
-            curr.entries[labeling].labeling = labeling
-            curr.entries[labeling].prNonBlank += prNonBlank
-            curr.entries[labeling].prBlank += prBlank
-            curr.entries[labeling].prTotal += prBlank + prNonBlank
-            curr.entries[labeling].prText = last.entries[prev_labeling].prText
-            # beam-labeling not changed, therefore also LM score unchanged from
-
-            #curr.entries[labeling].lmApplied = True # LM already applied at previous time-step for this beam-labeling
-
-            # extend current beam-labeling
-            # char_highscore = np.argpartition(mat[t, :], -5)[-5:] # run through 5 highest probability
-            char_highscore = np.where(mat[t, :] >= 0.5/maxC)[0] # run through all probable characters
-            for c in char_highscore:
-            #for c in range(maxC - 1):
-                # add new char to current beam-labeling
-                # newLabeling = labeling + (c,)
-                # newLabeling = simplify_label(newLabeling, blankIdx)
-                newLabeling = fast_simplify_label(labeling, c, blankIdx)
-
-                # if new labeling contains duplicate char at the end, only consider paths ending with a blank
-                if labeling and labeling[-1] == c:
-                    prNonBlank = mat[t, c] * last.entries[prev_labeling].prBlank
-                else:
-                    prNonBlank = mat[t, c] * last.entries[prev_labeling].prTotal
-
-                # add beam at current time-step if needed
-                addBeam(curr, newLabeling)
-
-                # fill in data
-                curr.entries[newLabeling].labeling = newLabeling
-                curr.entries[newLabeling].prNonBlank += prNonBlank
-                curr.entries[newLabeling].prTotal += prNonBlank
-
-                # apply LM
-                #applyLM(curr.entries[labeling], curr.entries[newLabeling], classes, lm)
-
-        # set new beam state
-
-        last = curr
-
-    # normalise LM scores according to beam-labeling-length
-    last.norm()
-
-    if dict_list == []:
-        bestLabeling = last.sort()[0] # get most probable labeling
-        res = ''
-        for i,l in enumerate(bestLabeling):
-            # removing repeated characters and blank.
-            if l not in ignore_idx and (not (i > 0 and bestLabeling[i - 1] == bestLabeling[i])):
-                res += classes[l]
-    else:
-        res = last.wordsearch(classes, ignore_idx, 20, dict_list)
-    return res
+        rows = np.flatnonzero(lengths > t)
+        if len(rows) == 0:
+            break
+        if len(rows) == B:
+            rows = slice(None)
+        mat = log_probs[rows, t]
+        R = len(mat)
+        k, p = keys[rows, :, 0], keys[rows, :, 1]
+        l, pv, n, w, ctx = (labels[rows, :, i] for i in range(5))
+        nb, b, text = probs[rows, :, 0], probs[rows, :, 1], probs[rows, :, 2]
+        total = np.logaddexp(nb, b)
+        row_index = np.arange(R)[:, None]
+        width = np.where(lengths[rows] == t + 1, K, beamWidth)
+
+        # characters probable enough to extend beams, ascending per row, [R, M]
+        above = mat >= threshold
+        M = int(above.sum(axis=1).max())
+        if charWidth and M > charWidth:
+            M = charWidth
+            chars = np.sort(np.argpartition(mat, maxC - M - 1, axis=1)[:, maxC - M:], axis=1)
+        elif M < maxC:
+            # characters above the threshold in ascending order, rows with fewer of them
+            # are padded with their least probable character, which extends nothing
+            counts = above.sum(axis=1)
+            above_rows, above_chars = np.nonzero(above)
+            slots = np.arange(len(above_rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+            chars = np.repeat(mat.argmin(axis=1)[:, None], M, axis=1)
+            chars[above_rows, slots] = above_chars
+        else:
+            chars = np.broadcast_to(np.arange(maxC), (R, maxC))
+        lp = mat[row_index, chars][:, None, :]
+        c = chars[:, None, :]
+        L = l[..., None]
+
+        # candidates [R, K, 1 + M]: every beam unchanged followed by its extensions
+        stride = K * (M + 1)
+        c_nb = np.empty((R, K, M + 1))
+        c_b = np.full((R, K, M + 1), -np.inf)
+        c_key = np.empty((R, K, M + 1), dtype=np.uint64)
+        # unchanged labeling: paths repeating its last element or ending with a blank
+        c_nb[..., 0] = np.where(l != EMPTY, nb + mat[row_index, np.maximum(l, 0)], -np.inf)
+        c_b[..., 0] = total + mat[:, blankIdx, None]
+        c_key[..., 0] = k
+        # a repeated character only continues paths ending with a blank
+        c_nb[..., 1:] = np.where(lp >= threshold, lp + np.where(L == c, b[..., None], total[..., None]), -np.inf)
+        # a blank after a blank or at the start leaves the labeling as is,
+        # a blank between different characters is dropped: (a, 0) + b -> (a, b)
+        same = (c == blankIdx) & ((L == blankIdx) | (L == EMPTY))
+        replace = (c != blankIdx) & (L == blankIdx) & (pv[..., None] != c)
+        c_key[..., 1:] = np.where(same, k[..., None], prefix_hash(np.where(replace, p[..., None], k[..., None]), c))
+        # a character that is neither a blank nor a repeat extends the text
+        extends = (c != blankIdx) & (c != L)
+        if lexicon is not None:
+            # the text has to stay a word prefix
+            c_word = np.empty((R, K, M + 1), dtype=np.int64)
+            c_word[..., 0] = w
+            c_word[..., 1:] = np.where(extends, lexicon.child(w[..., None], c), w[..., None])
+            c_nb[..., 1:] = np.where(c_word[..., 1:] == NO_NODE, -np.inf, c_nb[..., 1:])
+        if lm is not None:
+            c_text = np.empty((R, K, M + 1))
+            c_text[..., 0] = text
+            c_text[..., 1:] = text[..., None] + np.where(extends, lmWeight * lm.score(ctx[..., None], c) + lmBonus, 0.0)
+            c_ctx = np.empty((R, K, M + 1), dtype=np.int64)
+            c_ctx[..., 0] = ctx
+            c_ctx[..., 1:] = np.where(extends, lm.next_context(ctx[..., None], c), ctx[..., None])
+
+        # merge candidates with equal labelings, the earliest one describes the group
+        live = np.flatnonzero(np.isfinite(c_nb) | np.isfinite(c_b))
+        salted = (c_key ^ row_salt[:R]).ravel()[live]
+        order = np.argsort(salted)
+        salted = salted[order]
+        first = np.concatenate(([True], salted[1:] != salted[:-1]))
+        starts = np.flatnonzero(first)
+        order_live = live[order]
+        # most groups are a single candidate, only the others are summed,
+        # their members in candidate order so the sums do not depend on the sort
+        merged = np.flatnonzero(~(first & np.append(first[1:], True)))
+        group_of = np.cumsum(first)[merged] - 1
+        members = order_live[merged][np.argsort(group_of * (R * stride) + order_live[merged])]
+        order_live[merged] = members
+        g_first = order_live[starts]
+        g_nb = c_nb.ravel()[g_first]
+        g_b = c_b.ravel()[g_first]
+        merged_starts = np.flatnonzero(first[merged])
+        g_nb[group_of[merged_starts]] = np.logaddexp.reduceat(c_nb.ravel()[members], merged_starts)
+        g_b[group_of[merged_starts]] = np.logaddexp.reduceat(c_b.ravel()[members], merged_starts)
+
+        # keep the beamWidth most probable labelings of every row, ties go to the earliest
+        dense = np.full(R * stride, -np.inf)
+        dense[g_first] = np.logaddexp(g_nb, g_b)
+        if lm is not None:
+            dense[g_first] += c_text.ravel()[g_first]
+        if lexicon is not None:
+            # rows ending at this timestep keep whole words only
+            ending = np.repeat(lengths[rows] == t + 1, stride)
+            dense[ending & ~lexicon.is_word(np.maximum(c_word.ravel(), 0))] = -np.inf
+        group = np.empty(R * stride, dtype=np.int64)
+        group[g_first] = np.arange(len(g_first))
+        best = top_k(dense.reshape(R, stride), K)
+        src = (best + row_index * stride).ravel()
+        kept = np.isfinite(dense[src]) & (np.arange(K) < width[:, None]).ravel()
+        src = np.where(kept, src, g_first[0])
+        group = group[src]
+
+        # describe the kept labelings
+        r, j = src // stride, src % stride
+        beam, m = j // (M + 1), j % (M + 1) - 1
+        Ls, PVs, Ns = l[r, beam], pv[r, beam], n[r, beam]
+        ch = np.where(m >= 0, chars[r, np.maximum(m, 0)], -1)
+        appended = (m >= 0) & ~((ch == blankIdx) & ((Ls == blankIdx) | (Ls == EMPTY)))
+        replaced = appended & (Ls == blankIdx) & (ch != PVs)
+
+        # nodes of labelings that were extended
+        ids = np.arange(num_nodes, num_nodes + int(appended.sum()))
+        node_parent[ids] = np.where(replaced, node_parent[np.maximum(Ns, 0)], Ns)[appended]
+        node_char[ids] = ch[appended]
+        num_nodes += len(ids)
+        new_node = Ns.copy()
+        new_node[appended] = ids
+
+        keys[rows] = np.stack([
+            c_key.ravel()[src],
+            np.where(appended, np.where(replaced, p[r, beam], k[r, beam]), p[r, beam]),
+        ], axis=-1).reshape(R, K, 2)
+        labels[rows] = np.stack([
+            np.where(appended, ch, Ls),
+            np.where(appended & ~replaced, Ls, PVs),
+            new_node,
+            c_word.ravel()[src] if lexicon is not None else np.full_like(new_node, ROOT),
+            c_ctx.ravel()[src] if lm is not None else np.full_like(new_node, START),
+        ], axis=-1).reshape(R, K, 5)
+        probs[rows] = np.where(
+            kept[:, None],
+            np.stack([g_nb[group], g_b[group], c_text.ravel()[src] if lm is not None else np.zeros(len(src))], axis=-1),
+            -np.inf
+        ).reshape(R, K, 3)
+
+    results = []
+    total = np.logaddexp(probs[..., 0], probs[..., 1]) + probs[..., 2]
+    for i in range(B):
+        row = []
+        for j in np.argsort(-total[i], kind='stable')[:topN]:
+            if not np.isfinite(total[i, j]):
+                break
+            labeling = []
+            n = labels[i, j, 2]
+            while n >= 0:
+                labeling.append(int(node_char[n]))
+                n = node_parent[n]
+            row.append((tuple(reversed(labeling)), float(total[i, j])))
+        results.append(row)
+    return results
+
+def pad_batch(matrices):
+    "stack [T, C] matrices of different lengths into a padded [B, T, C] batch"
+    lengths = np.array([len(matrix) for matrix in matrices])
+    batch = np.zeros((len(matrices), lengths.max(), matrices[0].shape[1]), dtype=matrices[0].dtype)
+    for i, matrix in enumerate(matrices):
+        batch[i, :len(matrix)] = matrix
+    return batch, lengths
+
+def labeling_to_text(labeling, classes, ignore_idx):
+    "removing repeated characters and blank"
+    return ''.join(
+        classes[l] for i, l in enumerate(labeling)
+        if l not in ignore_idx and not (i > 0 and labeling[i - 1] == l)
+    )
 
 
 class CTCLabelConverter(object):
     """ Convert between text-label and text-index """
 
-    def __init__(self, character, separator_list = {}, dict_pathlist = {}):
+    def __init__(self, character, separator_list = {}, dict_pathlist = {}, lm_path = None):
         # character (str): set of the possible characters.
         dict_character = list(character)
 
@@ -273,24 +307,34 @@ class CTCLabelConverter(object):
             separator_char += sep
         self.ignore_idx = [0] + [i+1 for i,item in enumerate(separator_char)]
 
-        ####### latin dict
-        if len(separator_list) == 0:
-            dict_list = []
-            for lang, dict_path in dict_pathlist.items():
-                try:
-                    with open(dict_path, "r", encoding = "utf-8-sig") as input_file:
-                        word_count =  input_file.read().splitlines()
-                    dict_list += word_count
-                except:
-                    pass
-        else:
-            dict_list = {}
-            for lang, dict_path in dict_pathlist.items():
-                with open(dict_path, "r", encoding = "utf-8-sig") as input_file:
-                    word_count =  input_file.read().splitlines()
-                dict_list[lang] = word_count
+        # lookup tables of greedy decoding
+        self.character_table = np.array(self.character, dtype=object)
+        self.character_length = np.array([len(char) for char in self.character])
+        self.ignore_mask = np.zeros(len(self.character), dtype=bool)
+        self.ignore_mask[self.ignore_idx] = True
 
-        self.dict_list = dict_list
+        ####### latin dict
+        self.separator_char = separator_char
+        # word lists are loaded by the first word beam search, not by every process importing the recognizer
+        self.dict_pathlist = dict_pathlist
+        self.dict_character = character
+
+        # character language model, trained with python -m utils.language_model
+        self.lm = CharNgramLM.load(lm_path) if lm_path else None
+
+    @cached_property
+    def lexicon(self):
+        """All word lists in one Lexicon, words are split at spaces. None with separator characters."""
+        if len(self.separator_char) != 0:
+            return None
+        return Lexicon.load(self.dict_pathlist.values(), self.dict_character)
+
+    @cached_property
+    def lexicons(self):
+        """Lexicon of every language, used with separator characters."""
+        if len(self.separator_char) == 0:
+            return {}
+        return {lang: Lexicon.load([dict_path], self.dict_character) for lang, dict_path in self.dict_pathlist.items()}
 
     def encode(self, text, batch_max_length=25):
         """convert text-label into text-index.
@@ -308,61 +352,109 @@ class CTCLabelConverter(object):
         
         return indices, length
 
-    def decode_greedy(self, text_index, length):
-        """ convert text-index into text-label. """
-        texts = []
-        index = 0
-        for l in length:
-            t = text_index[index:index + l]
-            # Returns a boolean array where true is when the value is not repeated
-            a = np.insert(~((t[1:]==t[:-1])),0,True)
-            # Returns a boolean array where true is when the value is not in the ignore_idx list
-            b = ~np.isin(t,np.array(self.ignore_idx))
-            # Combine the two boolean array
-            c = a & b
-            # Gets the corresponding character according to the saved indexes
-            text = ''.join(np.array(self.character)[t[c.nonzero()]])
-            texts.append(text)
-            index += l
-        return texts
-
-    def decode_beamsearch(self, mat, beamWidth=5):
-        texts = []
-        for i in range(mat.shape[0]):
-            t = ctcBeamSearch(mat[i], self.character, self.ignore_idx, None, beamWidth=beamWidth)
-            texts.append(t)
-        return texts
+    def decode_greedy(self, text_index, lengths=None):
+        """Convert a [B, T] matrix of best indices into text, all rows at once.
 
-    def decode_wordbeamsearch(self, mat, beamWidth=5):
-        texts = []
-        argmax = np.argmax(mat, axis = 2)
+        Args:
+            text_index: [B, T] indices
+            lengths: [B] valid timesteps of every row, all T by default
 
-        for i in range(mat.shape[0]):
-            string = ''
-            # without separators - use space as separator
-            if len(self.separator_list) == 0:
-                space_idx = self.dict[' ']
+        Returns:
+            list of str
+        """
+        text_index = np.asarray(text_index)
+        batch_size, max_length = text_index.shape
+        if lengths is None:
+            lengths = np.full(batch_size, max_length)
+        # first index of every run that is not blank or a separator
+        keep = np.arange(max_length)[None, :] < np.asarray(lengths)[:, None]
+        keep[:, 1:] &= text_index[:, 1:] != text_index[:, :-1]
+        keep &= ~self.ignore_mask[text_index]
+
+        # the texts of all rows joined once, then cut per row
+        text = ''.join(self.character_table[text_index[keep]].tolist())
+        ends = np.cumsum(np.where(keep, self.character_length[text_index], 0).sum(axis=1))
+        starts = np.concatenate(([0], ends[:-1]))
+        return [text[start:end] for start, end in zip(starts.tolist(), ends.tolist())]
+
+    def decode_beamsearch(self, log_probs, lengths=None, beamWidth=5, lmWeight=0.0, lmBonus=0.0):
+        """Beam search decode [B, T, C] log probabilities, all rows at once.
+
+        The language model, if there is one, is applied with lmWeight and lmBonus, lmWeight 0 disables it.
+        """
+        lm = self.lm if lmWeight else None
+        return [
+            labeling_to_text(beams[0][0], self.character, self.ignore_idx) if beams else ''
+            for beams in ctc_beam_search(log_probs, lengths, beamWidth=beamWidth, lm=lm, lmWeight=lmWeight, lmBonus=lmBonus)
+        ]
+
+    def decode_words(self, segments, beamWidth=5, lmWeight=0.0, lmBonus=0.0):
+        """Beam search decode word segments in one batch.
+
+        Args:
+            segments: list of ([T, C] log probabilities, Lexicon or None)
+            lmWeight: weight of the language model, 0 disables it
+            lmBonus: per character bonus of the language model, see ctc_beam_search
+
+        Returns:
+            list of str, the most probable word of the lexicon, or the best labeling
+            for segments without a lexicon and segments no word fits
+        """
+        texts = [None] * len(segments)
+        lm = self.lm if lmWeight else None
+
+        # search constrained to the words of every lexicon
+        lexicons = {id(lexicon): lexicon for _, lexicon in segments if lexicon is not None}
+        for lexicon in lexicons.values():
+            index = [i for i, (_, lex) in enumerate(segments) if lex is lexicon]
+            batch, lengths = pad_batch([segments[i][0] for i in index])
+            for i, beams in zip(index, ctc_beam_search(
+                batch, lengths, beamWidth=beamWidth, lexicon=lexicon, lm=lm, lmWeight=lmWeight, lmBonus=lmBonus
+            )):
+                if beams:
+                    texts[i] = labeling_to_text(beams[0][0], self.character, self.ignore_idx)
+
+        # free search for the rest, a word among the best candidates is still preferred
+        index = [i for i, text in enumerate(texts) if text is None]
+        if index:
+            batch, lengths = pad_batch([segments[i][0] for i in index])
+            topN = MAX_WORD_CANDIDATES if any(segments[i][1] is not None for i in index) else 1
+            for i, beams in zip(index, ctc_beam_search(
+                batch, lengths, beamWidth=beamWidth, topN=topN, lm=lm, lmWeight=lmWeight, lmBonus=lmBonus
+            )):
+                candidates = [labeling_to_text(labeling, self.character, self.ignore_idx) for labeling, _ in beams]
+                best_text = candidates[0] if candidates else ''
+                lexicon = segments[i][1]
+                if lexicon is not None:
+                    best_text = next((text for text in candidates if text in lexicon), best_text)
+                texts[i] = best_text
+        return texts
 
-                data = np.argwhere(argmax[i]!=space_idx).flatten()
+    def decode_wordbeamsearch(self, log_probs, lengths=None, beamWidth=5, lmWeight=0.0, lmBonus=0.0):
+        """Word beam search decode [B, T, C] log probabilities, the words of all rows in one batch."""
+        batch_size, max_length, _ = log_probs.shape
+        if lengths is None:
+            lengths = np.full(batch_size, max_length)
+        argmax = np.argmax(log_probs, axis = 2)
+
+        segments, rows = [], []
+        for i, length in enumerate(lengths):
+            # without separators - use space as separator, a row is one word if there is no space character
+            if len(self.separator_char) == 0:
+                data = np.flatnonzero(argmax[i, :length] != self.dict.get(' ', EMPTY))
                 group = np.split(data, np.where(np.diff(data) != 1)[0]+1)
-                group = [ list(item) for item in group if len(item)>0]
-
-                for j, list_idx in enumerate(group):
-                    matrix = mat[i, list_idx,:]
-                    t = ctcBeamSearch(matrix, self.character, self.ignore_idx, None,\
-                                      beamWidth=beamWidth, dict_list=self.dict_list)
-                    if j == 0: string += t
-                    else: string += ' '+t
+                words = [(log_probs[i, list_idx, :], self.lexicon) for list_idx in group if len(list_idx)>0]
+                joiner = ' '
 
             # with separators
             else:
-                words = word_segmentation(argmax[i])
-
-                for word in words:
-                    matrix = mat[i, word[1][0]:word[1][1]+1,:]
-                    if word[0] == '': dict_list = []
-                    else: dict_list = self.dict_list[word[0]]
-                    t = ctcBeamSearch(matrix, self.character, self.ignore_idx, None, beamWidth=beamWidth, dict_list=dict_list)
-                    string += t
-            texts.append(string)
-        return texts
+                words = []
+                for word in word_segmentation(argmax[i, :length]):
+                    matrix = log_probs[i, word[1][0]:word[1][1]+1,:]
+                    words.append((matrix, self.lexicons.get(word[0])))
+                joiner = ''
+            rows.append((len(words), joiner))
+            segments += words
+
+        decoded = iter(self.decode_words(segments, beamWidth, lmWeight, lmBonus))
+        return [joiner.join(next(decoded) for _ in range(count)) for count, joiner in rows]
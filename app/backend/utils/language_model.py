@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import os
+import re
+
+import numpy as np
+
+from .lexicon import encode_words
+
+START = 0  # the CTC blank never appears in text, its index marks the start of a word
+NGRAM_WEIGHTS = (0.6, 0.3, 0.1)  # trigram, bigram, unigram interpolation weights
+
+
+class CharNgramLM:
+    """Character trigram language model over the recognizer's character indices.
+
+    log_probs[a, b, c] is log P(c | a, b) with trigram, bigram and unigram
+    estimates already interpolated, so scoring an extension is one array lookup.
+    A decoder keeps the two previous characters of a labeling as a single
+    context index a * C + b, starting from START, START.
+    """
+
+    def __init__(self, log_probs):
+        self.log_probs = log_probs
+        self.num_classes = log_probs.shape[0]
+        self.table = log_probs.reshape(-1, self.num_classes)  # context -> log P(c | context)
+
+    @classmethod
+    def train(cls, texts, character, weights=NGRAM_WEIGHTS):
+        """Count character trigrams of the words of texts.
+
+        Args:
+            texts: transcriptions, split into words at whitespace and unknown characters
+            character: characters of the recognition model, index i + 1 in its output
+            weights: trigram, bigram and unigram interpolation weights
+
+        Returns:
+            CharNgramLM
+        """
+        C = len(character) + 1
+        separators = re.compile(f"[^{re.escape(character)}]+")
+        words = [word for text in texts for word in separators.split(text) if word]
+        _, matrix, lengths = encode_words(words, character)
+
+        # every word is preceded by two START markers
+        padded = np.concatenate([np.full((len(matrix), 2), START, dtype=np.int32), matrix], axis=1)
+        positions = np.arange(matrix.shape[1])[None, :] < lengths[:, None]
+        a, b, c = padded[:, :-2][positions], padded[:, 1:-1][positions], padded[:, 2:][positions]
+
+        trigram = np.bincount((a * C + b) * C + c, minlength=C ** 3).reshape(C, C, C).astype(np.float64)
+        bigram = np.bincount(b * C + c, minlength=C ** 2).reshape(C, C).astype(np.float64)
+        # add-one unigram, so every character keeps some probability
+        unigram = np.bincount(c, minlength=C).astype(np.float64) + 1
+        unigram[START] = 0
+        unigram /= unigram.sum()
+
+        # contexts never seen give their weight to the lower orders
+        w3, w2, w1 = weights
+        tri_total = trigram.sum(axis=2, keepdims=True)
+        bi_total = bigram.sum(axis=1, keepdims=True)
+        w3 = np.where(tri_total > 0, w3, 0.0)
+        w2 = np.where(bi_total > 0, w2, 0.0)[None]
+        probs = (
+            w3 * trigram / np.maximum(tri_total, 1)
+            + w2 * (bigram / np.maximum(bi_total, 1))[None]
+            + w1 * unigram
+        ) / (w3 + w2 + w1)
+
+        with np.errstate(divide='ignore'):
+            return cls(np.log(probs).astype(np.float32))
+
+    @classmethod
+    def load(cls, path):
+        """Memory map a model saved with save, None if there is none."""
+        if not os.path.exists(path):
+            return None
+        return cls(np.load(path, mmap_mode='r'))
+
+    def save(self, path):
+        np.save(path, np.asarray(self.log_probs))
+
+    def score(self, context, chars):
+        """log P(chars | context)"""
+        return self.table[context, chars]
+
+    def next_context(self, context, chars):
+        """Context after appending chars."""
+        return context % self.num_classes * self.num_classes + chars
+
+
+def read_labels(path):
+    """Texts of an EasyOCR trainer labels.csv, `filename,words` per line."""
+    with open(path, "r", encoding = "utf-8-sig") as input_file:
+        lines = input_file.read().splitlines()[1:]
+    return [line.split(',', 1)[1] for line in lines if ',' in line]
+
+async def read_transcriptions():
+    """User transcriptions collected by the bot."""
+    from database import db
+
+    await db.connect()
+    try:
+        return await db.get_transcriptions()
+    finally:
+        await db.close()
+
+
+if __name__ == '__main__':
+    # python -m utils.language_model --labels <dataset>/labels.csv ...
+    from .recognition import character, lm_path
+
+    parser = argparse.ArgumentParser(description="Train the character language model used by beam search")
+    parser.add_argument("--labels", nargs="*", default=[], help="labels.csv files of training datasets")
+    parser.add_argument("--no-transcriptions", action="store_true", help="do not read user transcriptions from MongoDB")
+    parser.add_argument("--output", default=lm_path)
+    args = parser.parse_args()
+
+    texts = [text for path in args.labels for text in read_labels(path)]
+    if not args.no_transcriptions:
+        texts += asyncio.run(read_transcriptions())
+
+    CharNgramLM.train(texts, character).save(args.output)
+    print(f"Trained on {len(texts)} texts, saved to {args.output}")
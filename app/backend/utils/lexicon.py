@@ -0,0 +1,203 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+NO_NODE = -1  # child of a trie node that has no edge for a character
+ROOT = 0
+LEXICON_CACHE_DIR = os.getenv("LEXICON_CACHE_DIR")  # trie caches, next to the word lists by default
+
+
+def _char_ids(lines, character):
+    """Character indices of lines joined together, 0 for unknown characters.
+
+    Returns:
+        ids: [N] index of every character
+        word: [N] line of every character
+        lengths: [W] length of every line
+        valid: [W] bool, lines made only of known characters
+    """
+    codes = np.frombuffer('\n'.join(lines).encode('utf-32-le'), dtype=np.uint32)
+    newline = codes == ord('\n')
+    word = np.cumsum(newline)[~newline]
+    codes = codes[~newline]
+
+    # code point -> character index, 0 for unknown characters
+    charset = np.array([ord(c) for c in character])
+    table = np.zeros(max(charset.max(), codes.max(initial=0)) + 1, dtype=np.int32)
+    table[charset] = np.arange(1, len(charset) + 1)
+    ids = table[codes]
+    known = ids > 0
+
+    lengths = np.bincount(word, minlength=len(lines))
+    valid = (lengths > 0) & (np.bincount(word[~known], minlength=len(lines)) == 0)
+    return ids, word, lengths, valid
+
+def valid_words(lines, character):
+    """[W] bool, words made only of known characters"""
+    return _char_ids(lines, character)[3]
+
+def encode_words(lines, character):
+    """Map words to character indices, index 0 is the CTC blank.
+
+    Returns:
+        valid: [W] bool, words made only of known characters
+        matrix: [V, L] indices of the valid words padded with -1
+        lengths: [V] length of every valid word
+    """
+    ids, word, lengths, valid = _char_ids(lines, character)
+
+    # positions of the characters of valid words in the padded matrix
+    keep = valid[word]
+    row = np.cumsum(valid)[word[keep]] - 1
+    col = np.arange(len(word)) - (np.cumsum(lengths) - lengths)[word]
+    matrix = np.full((int(valid.sum()), int(lengths[valid].max(initial=0))), -1, dtype=np.int32)
+    matrix[row, col[keep]] = ids[keep]
+    return valid, matrix, lengths[valid]
+
+def build_trie(matrix, lengths, num_classes):
+    """Prefix trie of words given as padded character indices.
+
+    Nodes are numbered breadth first with children in character order, so node
+    i > 0 is described by a single sorted edge key parent * num_classes + char.
+
+    Returns:
+        edges: [N - 1] int64 sorted edge keys of nodes 1..N-1
+        terminal: [N] bool, nodes ending a word
+    """
+    order = np.lexsort(matrix.T[::-1])
+    matrix, lengths = matrix[order], lengths[order]
+    unique = np.concatenate(([True], (matrix[1:] != matrix[:-1]).any(axis=1)))
+    matrix, lengths = matrix[unique], lengths[unique]
+
+    # length of the prefix every word shares with the previous one
+    diff = matrix[1:] != matrix[:-1]
+    common = np.concatenate(([0], np.where(diff.any(axis=1), diff.argmax(axis=1), matrix.shape[1])))
+
+    edges, ends = [], []
+    node = np.full(len(matrix), ROOT, dtype=np.int64)  # node of every word's prefix of the current depth
+    num_nodes = 1
+    for depth in range(matrix.shape[1]):
+        new = (lengths > depth) & (common <= depth)
+        ids = num_nodes - 1 + np.cumsum(new)
+        edges.append(node[new] * num_classes + matrix[new, depth])
+        # words sharing a prefix are adjacent, the first of them created its node
+        node = np.maximum.accumulate(np.where(new, ids, 0))
+        ends.append(node[lengths == depth + 1])
+        num_nodes += int(new.sum())
+
+    terminal = np.zeros(num_nodes, dtype=bool)
+    terminal[np.concatenate(ends or [np.empty(0, dtype=np.int64)])] = True
+    return np.concatenate(edges or [np.empty(0, dtype=np.int64)]).astype(np.int64), terminal
+
+
+class Lexicon:
+    """Word list for lexicon-constrained decoding.
+
+    Words are kept in a frozenset for lookups of whole texts and in a prefix
+    trie over character indices for pruning beams that cannot become a word.
+    The trie is stored as flat arrays cached next to the word list, or in
+    LEXICON_CACHE_DIR, so it is built once and memory mapped by every process afterwards.
+    Build the cache ahead of time with `python -m utils.lexicon`.
+    """
+
+    def __init__(self, words, edges, terminal, num_classes):
+        self.words = words
+        self.edges = edges
+        self.terminal = terminal
+        self.num_classes = num_classes
+
+    @classmethod
+    def load(cls, paths, character):
+        """Load word lists, one word per line. Missing files are skipped.
+
+        Args:
+            paths: word list files
+            character: characters of the recognition model, index i + 1 in its output
+
+        Returns:
+            Lexicon | None: None if no word can be recognized
+        """
+        paths = [os.path.abspath(path) for path in paths if os.path.exists(path)]
+        lines = []
+        for path in paths:
+            with open(path, "r", encoding = "utf-8-sig") as input_file:
+                lines += input_file.read().splitlines()
+
+        valid = valid_words(lines, character)
+        if not valid.any():
+            return None
+        words = frozenset(line for line, ok in zip(lines, valid) if ok)
+
+        if LEXICON_CACHE_DIR:
+            cache_dir = os.path.join(LEXICON_CACHE_DIR, f"{os.path.basename(paths[0])}.lexicon")
+        else:
+            cache_dir = f"{paths[0]}.lexicon"
+        meta = {"sources": paths, "character": character}
+        trie = cls._read_cache(cache_dir, meta)
+        if trie is None:
+            _, matrix, lengths = encode_words(lines, character)
+            trie = build_trie(matrix, lengths, len(character) + 1)
+            cls._write_cache(cache_dir, meta, *trie)
+        return cls(words, *trie, len(character) + 1)
+
+    @staticmethod
+    def _read_cache(cache_dir, meta):
+        try:
+            with open(os.path.join(cache_dir, "meta.json"), encoding="utf-8") as f:
+                if json.load(f) != meta:
+                    return None
+            built_at = os.path.getmtime(os.path.join(cache_dir, "meta.json"))
+            if any(os.path.getmtime(path) > built_at for path in meta["sources"]):
+                return None
+            return (
+                np.load(os.path.join(cache_dir, "edges.npy"), mmap_mode='r'),
+                np.load(os.path.join(cache_dir, "terminal.npy"), mmap_mode='r'),
+            )
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_cache(cache_dir, meta, edges, terminal):
+        # written aside and renamed, processes starting together may build it at the same time
+        try:
+            os.makedirs(os.path.dirname(cache_dir), exist_ok=True)
+            tmp_dir = tempfile.mkdtemp(prefix=".lexicon-", dir=os.path.dirname(cache_dir))
+        except OSError:
+            return  # read-only, the trie stays in memory
+        try:
+            np.save(os.path.join(tmp_dir, "edges.npy"), edges)
+            np.save(os.path.join(tmp_dir, "terminal.npy"), terminal)
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            os.rename(tmp_dir, cache_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def __contains__(self, text):
+        return text in self.words
+
+    def __len__(self):
+        return len(self.words)
+
+    def child(self, nodes, chars):
+        """Trie nodes reached from nodes by chars, NO_NODE where no word continues that way."""
+        keys = np.asarray(nodes, dtype=np.int64) * self.num_classes + chars
+        i = np.minimum(np.searchsorted(self.edges, keys), len(self.edges) - 1)
+        return np.where(self.edges[i] == keys, i + 1, NO_NODE)
+
+    def is_word(self, nodes):
+        return self.terminal[nodes]
+
+
+if __name__ == '__main__':
+    # loading the recognizer's word lists writes the trie caches
+    from .recognition import converter
+
+    lexicons = dict(converter.lexicons, all=converter.lexicon)
+    for lang, lexicon in lexicons.items():
+        if lexicon is not None:
+            print(f"{lang}: {len(lexicon)} words, {len(lexicon.terminal)} trie nodes")
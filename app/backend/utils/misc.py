@@ -104,3 +104,50 @@ def get_image_list(free_list, img, model_height = 64, sort_output = True):
         image_list = sorted(image_list, key=lambda item: item[0][0][1]) # sort by vertical position
     return image_list
 
+
+### Recognition batching
+
+def batch_image_list(crops, width_step=128, max_batch_size=32):
+    '''
+    Group recognition crops into batches of equal height and bucketed width.
+    Vertical crops from compute_ratio_and_resize are taller than model_height, they get batches of their own.
+    Every crop is right-padded with its last column up to the bucket width (as in EasyOCR NormalizePAD)
+    Returns list of (indices, batch, widths): positions in `crops`, float32 [B, 1, H, W] in [0, 1], real widths
+    '''
+    buckets = {}
+    for i, crop in enumerate(crops):
+        bucket_width = -(-crop.shape[1] // width_step) * width_step
+        buckets.setdefault((crop.shape[0], bucket_width), []).append(i)
+
+    batches = []
+    for (height, bucket_width), bucket in sorted(buckets.items()):
+        for start in range(0, len(bucket), max_batch_size):
+            indices = bucket[start:start + max_batch_size]
+            batch = np.empty((len(indices), 1, height, bucket_width), dtype=np.float32)
+            widths = np.empty(len(indices), dtype=np.int32)
+            for row, i in enumerate(indices):
+                crop = crops[i]
+                width = crop.shape[1]
+                batch[row, 0, :, :width] = crop
+                batch[row, 0, :, width:] = crop[:, width - 1:width]
+                widths[row] = width
+            batch /= 255.
+            batches.append((indices, batch, widths))
+    return batches
+
+def contrast_grey(img):
+    high = np.percentile(img, 90)
+    low  = np.percentile(img, 10)
+    return (high-low)/np.maximum(10, high+low), high, low
+
+def adjust_contrast_grey(img, target = 0.4):
+    '''
+    Stretch the histogram of a low contrast grayscale crop, crops with contrast >= target are returned as is
+    '''
+    contrast, high, low = contrast_grey(img)
+    if contrast < target:
+        img = img.astype(int)
+        ratio = 200./np.maximum(10, high-low)
+        img = (img - low + 25)*ratio
+        img = np.clip(img, 0, 255).astype(np.uint8)
+    return img
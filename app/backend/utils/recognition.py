@@ -7,52 +7,62 @@ from .converter import CTCLabelConverter
 character = '0123456789!ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyzАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯабвгдеёжзийклмнопрстуфхцчшщъыьэюяЂђЃѓЄєІіЇїЈјЉљЊњЋћЌќЎўЏџҐґҒғҚқҮүҲҳҶҷӀӏӢӣӨөӮӯ'
 separator_list = {'ru': []}
 dict_list = {'ru': f"{os.path.dirname(os.path.abspath(__file__))}/ru.txt"}
+lm_path = f"{os.path.dirname(os.path.abspath(__file__))}/ru_lm.npy"
 
-converter = CTCLabelConverter(character, separator_list, dict_list)
+converter = CTCLabelConverter(character, separator_list, dict_list, lm_path)
 
-def softmax(x, axis=None):
-    exp_x = np.exp(x)
-    sum_exp = np.sum(exp_x, axis=axis, keepdims=True)
-    return exp_x / sum_exp
+def log_softmax(x, axis=-1):
+    """Numerically stable log of softmax."""
+    x = x - x.max(axis=axis, keepdims=True)
+    return x - np.log(np.exp(x).sum(axis=axis, keepdims=True))
 
 
-def custom_mean(x):
-    return x.prod()**(2.0/np.sqrt(len(x)))
+def custom_mean(log_x, mask):
+    """Per row x.prod()**(2.0/np.sqrt(len(x))) of the masked values, computed from their logs.
 
+    Args:
+        log_x: [B, T] log probabilities
+        mask: [B, T] bool, values taking part in the mean
 
-# здесь batch_size строго 1
-def postprocess(preds, decoder='greedy', beamWidth=5):
-    result = []
+    Returns:
+        np.ndarray: [B] scores, 0 for rows without values
+    """
+    count = mask.sum(axis=1)
+    log_prod = np.where(mask, log_x, 0).sum(axis=1)
+    return np.where(count > 0, np.exp(2.0 * log_prod / np.sqrt(np.maximum(count, 1))), 0.0)
 
-    # Select max probabilty (greedy decoding) then decode index to character
-    preds_size = np.full(1, preds.shape[1], dtype=np.int32)
 
-    preds_prob = softmax(preds, axis=2)
-    pred_norm = preds_prob.sum(axis=2)
-    preds_prob = preds_prob / np.expand_dims(pred_norm, axis=-1)
+def postprocess(preds, lengths=None, decoder='greedy', beamWidth=5, lmWeight=0.0, lmBonus=0.0):
+    """CTC decode a batch of recognition outputs.
+
+    Args:
+        preds: [B, T, C] logits
+        lengths: [B] valid timesteps of every row of a padded batch, all T by default
+        decoder: 'greedy', 'beamsearch' or 'wordbeamsearch'
+        beamWidth: beam width of the beam search decoders
+        lmWeight: weight of the character language model in the beam search decoders, 0 disables it
+        lmBonus: language model bonus for every character, keeps it from favouring short texts
+
+    Returns:
+        list of [text, confidence] per row
+    """
+    batch_size, max_length, _ = preds.shape
+    if lengths is None:
+        lengths = np.full(batch_size, max_length, dtype=np.int32)
+    lengths = np.asarray(lengths)
+    valid = np.arange(max_length)[None, :] < lengths[:, None]
+
+    log_probs = log_softmax(preds, axis=2)
+    preds_index = log_probs.argmax(axis=2)
+    max_log_probs = np.take_along_axis(log_probs, preds_index[..., None], axis=2)[..., 0]
 
     if decoder == 'greedy':
-        # Select max probabilty (greedy decoding) then decode index to character
-        preds_index = preds_prob.argmax(axis=2)
-        preds_index = preds_index.ravel()
-        preds_str = converter.decode_greedy(preds_index, preds_size)
+        preds_str = converter.decode_greedy(preds_index, lengths)
     elif decoder == 'beamsearch':
-        preds_str = converter.decode_beamsearch(preds_prob, beamWidth=beamWidth)
+        preds_str = converter.decode_beamsearch(log_probs, lengths, beamWidth=beamWidth, lmWeight=lmWeight, lmBonus=lmBonus)
     elif decoder == 'wordbeamsearch':
-        preds_str = converter.decode_wordbeamsearch(preds_prob, beamWidth=beamWidth)
-
-    values = preds_prob.max(axis=2)
-    indices = preds_prob.argmax(axis=2)
-    preds_max_prob = []
-    for v,i in zip(values, indices):
-        max_probs = v[i!=0]
-        if len(max_probs)>0:
-            preds_max_prob.append(max_probs)
-        else:
-            preds_max_prob.append(np.array([0]))
-
-    for pred, pred_max_prob in zip(preds_str, preds_max_prob):
-        confidence_score = custom_mean(pred_max_prob)
-        result.append([pred, confidence_score])
-
-    return result
\ No newline at end of file
+        preds_str = converter.decode_wordbeamsearch(log_probs, lengths, beamWidth=beamWidth, lmWeight=lmWeight, lmBonus=lmBonus)
+
+    # confidence from the best non-blank probabilities
+    confidence = custom_mean(max_log_probs, valid & (preds_index != 0))
+    return [[pred, float(score)] for pred, score in zip(preds_str, confidence)]
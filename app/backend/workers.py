@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+from PIL import ExifTags, Image, ImageOps
+from utils import detection, misc, recognition
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# CPU stage settings
+CPU_EXECUTOR = os.getenv("CPU_EXECUTOR", "process")  # "process" or "thread"
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", os.cpu_count() or 1))
+RECOGNITION_DECODER = os.getenv("RECOGNITION_DECODER", "greedy")  # "greedy", "beamsearch" or "wordbeamsearch"
+RECOGNITION_BEAM_WIDTH = int(os.getenv("RECOGNITION_BEAM_WIDTH", 5))
+RECOGNITION_LM_WEIGHT = float(os.getenv("RECOGNITION_LM_WEIGHT", 0.5))  # character language model weight, 0 disables it
+RECOGNITION_LM_BONUS = float(os.getenv("RECOGNITION_LM_BONUS", 1.0))  # added per character to offset the language model's length penalty
+
+
+class SharedArray:
+    """Numpy array backed by shared memory.
+
+    Pickled as a reference to the memory block, so a process pool worker
+    attaches to it instead of receiving a copy. The creator owns the block
+    and must unlink it, workers only release their attachment.
+    """
+
+    def __init__(self, shape, dtype, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.attached = name is not None
+        size = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+        self.shm = shared_memory.SharedMemory(name=name, create=not self.attached, size=size)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def __getstate__(self):
+        return self.shm.name, self.shape, self.dtype.str
+
+    def __setstate__(self, state):
+        name, shape, dtype = state
+        self.__init__(shape, dtype, name=name)
+
+    def release(self):
+        """Detach a worker from the block, no-op in the owner."""
+        if self.attached:
+            del self.array
+            self.shm.close()
+
+    def unlink(self):
+        """Free the block, called by the owner once no worker uses it."""
+        del self.array
+        self.shm.close()
+        self.shm.unlink()
+
+
+# EXIF orientations that turn the image by 90 degrees
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+def image_size(img_bytes):
+    """(width, height) of an image as it is displayed, only the header is parsed."""
+    image = Image.open(BytesIO(img_bytes))
+    width, height = image.size
+    if image.getexif().get(ExifTags.Base.Orientation, 1) in TRANSPOSED_ORIENTATIONS:
+        return height, width
+    return width, height
+
+def decode_image(img_bytes):
+    """Decode an image into an [H, W, 3] RGB array, turned upright by its EXIF orientation.
+
+    Grayscale and palette images are converted, transparent pixels are put on white
+    since scans with an alpha channel usually have dark text on a transparent page.
+    """
+    with Image.open(BytesIO(img_bytes)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+            image = Image.alpha_composite(Image.new("RGBA", image.size, "white"), image.convert("RGBA"))
+        return np.array(image.convert("RGB"))
+
+
+### Stages executed in the pool
+
+def prepare_detection(img_bytes, image_gray):
+    """Decode the image, build detector input and write grayscale copy into image_gray.
+
+    Returns:
+        tuple: detector input [1, 3, H, W], resize ratio, hash of decoded pixels and stage timings
+    """
+    t1 = time.perf_counter()
+    image = decode_image(img_bytes)
+
+    pixel_hash = hashlib.sha256(str(image.shape).encode())
+    pixel_hash.update(image.data)
+    t2 = time.perf_counter()
+
+    img_resized, target_ratio, _ = misc.resize_aspect_ratio(
+        image, 640, interpolation=cv2.INTER_LINEAR, mag_ratio=1.5
+    )
+    detector_input = misc.normalizeMeanVariance(img_resized)
+    detector_input = np.transpose(detector_input, (2, 0, 1))[None, ...]
+
+    cv2.cvtColor(image, cv2.COLOR_RGB2GRAY, dst=image_gray.array)
+    image_gray.release()
+    t3 = time.perf_counter()
+    return detector_input, target_ratio, pixel_hash.hexdigest(), {"decode": t2 - t1, "resize": t3 - t2}
+
+def extract_crops(maps, target_ratio, image_gray):
+    """Turn detector heatmaps into boxes and cut recognition crops out of image_gray.
+
+    Returns:
+        tuple: (box, crop) pairs in detection order and stage timings
+    """
+    t1 = time.perf_counter()
+    text_map = maps[0, :, :, 0]
+    link_map = maps[0, :, :, 1]
+
+    bboxes, _ = detection.getDetBoxes(
+        text_map, link_map,
+        text_threshold=0.7, link_threshold=0.4,
+        low_text=0.4, estimate_num_chars=None
+    )
+
+    ratio_h = ratio_w = 1 / target_ratio
+    bboxes = detection.adjustResultCoordinates(bboxes, ratio_w, ratio_h)
+    t2 = time.perf_counter()
+
+    image_list = misc.get_image_list(bboxes, image_gray.array, model_height=64, sort_output=False)
+    image_gray.release()
+    t3 = time.perf_counter()
+    return image_list, {"box_postprocessing": t2 - t1, "crop_extraction": t3 - t2}
+
+def decode_batch(preds, lengths):
+    """CTC decode every row of a padded recognition batch.
+
+    Returns:
+        list: [text, confidence] per row
+    """
+    return recognition.postprocess(
+        preds, lengths, decoder=RECOGNITION_DECODER, beamWidth=RECOGNITION_BEAM_WIDTH,
+        lmWeight=RECOGNITION_LM_WEIGHT, lmBonus=RECOGNITION_LM_BONUS
+    )
+
+
+class CPUPool:
+    def __init__(self):
+        self.executor = None
+
+    async def start(self):
+        """Create the executor for CPU bound stages."""
+        if not self.executor:
+            self.executor = self._create_executor()
+            logger.info(f"Started {CPU_EXECUTOR} pool with {CPU_WORKERS} workers")
+
+    def _create_executor(self):
+        if CPU_EXECUTOR == "process":
+            # spawn: forking a process that already runs mongo and aiohttp threads is unsafe
+            return ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return ThreadPoolExecutor(max_workers=CPU_WORKERS)
+
+    async def close(self):
+        """Wait for running stages and shut the executor down."""
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+            logger.info("Closed CPU pool")
+
+    async def run(self, func, *args):
+        """Run func(*args) in the pool without blocking the event loop.
+
+        A process pool whose worker died, e.g. killed by SIGBUS when /dev/shm is
+        full, fails every call from then on. It is replaced and the call is
+        retried once, calls that were running on it only failed with it.
+        """
+        for attempt in range(2):
+            executor = self.executor
+            try:
+                return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+            except BrokenProcessPool:
+                # concurrent calls see the same broken pool, only the first replaces it
+                if self.executor is executor:
+                    logger.error("CPU pool worker died, replacing the pool")
+                    executor.shutdown(wait=False)
+                    self.executor = self._create_executor()
+                if attempt == 1:
+                    raise
+
+# Create a global CPU pool instance
+cpu_pool = CPUPool()
@@ -1,18 +1,32 @@
+import asyncio
 import logging
+import os
+import time
 import uuid
-from io import BytesIO
 
-import requests
 from aiogram import Bot, Router, types
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.filters import Command
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from PIL import Image
 
+from services.albums import albums
+from services.backend import backend
+from services.history import DELETE_BATCH_SIZE, delete_limiter, history
 
-BACKEND_HOST = "backend"
-BACKEND_PORT = "5000"
+
+DOWNLOAD_TIMEOUT = 30  # seconds
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+PROGRESS_EDIT_INTERVAL = 1.0  # seconds between edits of the progress message, Telegram limits edits
+MESSAGE_MAX_LENGTH = 4096
+
+# image types Pillow can open, as the backend decodes with it, e.g. HEIC and SVG are not among them
+Image.init()
+IMAGE_MIME_TYPES = frozenset(
+    mime for format, mime in Image.MIME.items() if format in Image.OPEN and mime.startswith("image/")
+)
 
 # Configure logging with DEBUG level
 logging.basicConfig(level=logging.INFO)
@@ -26,9 +40,6 @@ class UserStates(StatesGroup):
     waiting_for_rating = State()
     waiting_for_transcription = State()
 
-# Store request_id and rating for transcription
-user_requests = {}
-
 @router.message(Command('start'))
 async def start(message: Message, state: FSMContext):
     await state.set_state(UserStates.waiting_for_photo)
@@ -41,14 +52,35 @@ async def help(message: Message, state: FSMContext):
 
 @router.message(Command("clear"))
 async def all_clear(message: Message, bot: Bot, state: FSMContext):
-    try:
-        for i in range(message.message_id, 0, -1):
-            await bot.delete_message(message.from_user.id, i)
-    except TelegramBadRequest as ex:
-        if ex.message == "Bad Request: message to delete not found":
-            logger.info("Все сообщения удалены!")
+    # only messages that were actually sent in this chat, deleted in batches,
+    # ids stay in history until their batch is done so a failed /clear can be repeated
+    message_ids = await history.get_all(message.chat.id)
+    for start in range(0, len(message_ids), DELETE_BATCH_SIZE):
+        batch = message_ids[start:start + DELETE_BATCH_SIZE]
+        while True:
+            await delete_limiter.acquire()
+            try:
+                await bot.delete_messages(message.chat.id, batch)
+                break
+            except TelegramRetryAfter as ex:
+                logger.info(f"Flood control on delete, retrying in {ex.retry_after} seconds")
+                await asyncio.sleep(ex.retry_after)
+            except TelegramBadRequest as ex:
+                # already deleted or too old, retrying won't help
+                logger.info(f"Failed to delete messages: {ex.message}")
+                break
+        await history.remove(message.chat.id, batch)
+    logger.info("Все сообщения удалены!")
     await state.set_state(UserStates.waiting_for_photo)
 
+def telegram_file_stream(bot: Bot, file_path: str):
+    """Chunks of a file on Telegram servers, the file is never held in memory as a whole"""
+    if bot.session.api.is_local:
+        # local Bot API server keeps files on disk
+        return open(bot.session.api.wrap_local_file.to_local(file_path), "rb")
+    url = bot.session.api.file_url(bot.token, file_path)
+    return bot.session.stream_content(url=url, timeout=DOWNLOAD_TIMEOUT, chunk_size=DOWNLOAD_CHUNK_SIZE)
+
 def get_rating_keyboard():
     """Create inline keyboard with rating buttons"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -67,43 +99,125 @@ def get_rating_keyboard():
     ])
     return keyboard
 
+def get_image(message: types.Message):
+    """Page of a photo or of an image sent as a document, None for anything else.
+
+    Pages are plain dicts, albums are collected in shared storage.
+    """
+    if message.content_type == types.ContentType.PHOTO:
+        # Telegram recompresses photos to JPEG and keeps no file name
+        return {
+            "message_id": message.message_id, "file_id": message.photo[-1].file_id,
+            "file_name": None, "mime_type": "image/jpeg",
+        }
+    if message.content_type == types.ContentType.DOCUMENT and message.document.mime_type in IMAGE_MIME_TYPES:
+        return {
+            "message_id": message.message_id, "file_id": message.document.file_id,
+            "file_name": message.document.file_name, "mime_type": message.document.mime_type,
+        }
+    return None
+
+class PageProgress:
+    """Shows partial results of a page by editing the progress message"""
+
+    def __init__(self, message: Message):
+        self.message = message
+        self.boxes = 0
+        self.words = {}  # box index -> text
+        self.edited_at = 0.0
+
+    async def __call__(self, event: dict):
+        if event["event"] == "detections":
+            # sent again when the request is retried
+            self.boxes = len(event["boxes"])
+            self.words = {}
+        elif event["event"] == "words":
+            for word in event["words"]:
+                self.words[word["index"]] = word["text"]
+
+        now = time.monotonic()
+        if now - self.edited_at < PROGRESS_EDIT_INTERVAL:
+            return
+        self.edited_at = now
+
+        text = f"Найдено фрагментов текста: {self.boxes}, распознано: {len(self.words)}"
+        if self.words:
+            text += "\n\n" + " ".join(self.words[i] for i in sorted(self.words))
+        try:
+            await self.message.edit_text(text[:MESSAGE_MAX_LENGTH])
+        except (TelegramBadRequest, TelegramRetryAfter) as ex:
+            # progress is best effort, the final answer is sent separately
+            logger.debug(f"Failed to update progress: {ex.message}")
+
+async def skip_progress(event: dict):
+    pass
+
+async def recognize_page(page: dict, user_id: int, bot: Bot, progress=skip_progress):
+    """Send one image to the backend, returns request_id and the backend answer"""
+    file = await bot.get_file(page["file_id"])
+    file_path = file.file_path
+
+    request_id = str(uuid.uuid4())
+    status, answer = await backend.predict_stream(
+        user_id, request_id, lambda: telegram_file_stream(bot, file_path), progress,
+        filename=page["file_name"] or os.path.basename(file_path), content_type=page["mime_type"],
+    )
+    if status != 200 or answer is None or answer["status"] != "ok":
+        return request_id, None
+    return request_id, answer
+
 @router.message(UserStates.waiting_for_photo)
 async def photo_handler(message: types.Message, bot: Bot, state: FSMContext):
-    if message.content_type == types.ContentType.PHOTO:
-        logger.debug("Processing new photo")
-        
-        file = await bot.get_file(message.photo[-1].file_id)
-        file_path = file.file_path
-        img_data: BytesIO = await bot.download_file(file_path)
+    page = get_image(message)
+    if page is None:
+        if message.content_type == types.ContentType.DOCUMENT and (message.document.mime_type or "").startswith("image/"):
+            await message.answer("Этот формат изображения не поддерживается, отправьте JPEG или PNG.")
+        return
 
-        await bot.send_message(message.from_user.id, "Фото загружено, идет обработка!")
+    if message.media_group_id:
+        # pages of an album arrive as separate messages, the first one collects the rest
+        if not await albums.add(message.media_group_id, page):
+            return
+        pages = await albums.collect(message.media_group_id)
+    else:
+        pages = [page]
 
-        url = f'http://{BACKEND_HOST}:{BACKEND_PORT}/predict'
-        request_id = str(uuid.uuid4())
-        files = {'file': img_data}
-        data = {'user_id': str(message.from_user.id), 'request_id': request_id}
-        response = requests.post(url, files=files, data=data)
-        
-        if response.status_code == 200:
-            answer = response.json()
-            # Store request_id for this user
-            user_requests[message.from_user.id] = request_id
-            
-            # Send prediction result with rating keyboard
-            await bot.send_message(
-                message.from_user.id,
-                f"Ответ модели: {answer['prediction']}, уверенность {answer['confidence']*100:.2f}%"
-            )
-            await bot.send_message(
-                message.from_user.id,
-                "Оцените качество распознавания:",
-                reply_markup=get_rating_keyboard()
-            )
-            # Set state to waiting for rating
-            await state.set_state(UserStates.waiting_for_rating)
-        else:
-            await bot.send_message(message.from_user.id, "Что-то пошло не так")
-            await state.set_state(UserStates.waiting_for_photo)
+    logger.debug(f"Processing {len(pages)} new photo(s)")
+    progress_message = await bot.send_message(message.from_user.id, "Фото загружено, идет обработка!")
+
+    if len(pages) == 1:
+        # partial results of a single page are shown while it is processed
+        results = [await recognize_page(pages[0], message.from_user.id, bot, PageProgress(progress_message))]
+    else:
+        results = await asyncio.gather(*[recognize_page(page, message.from_user.id, bot) for page in pages])
+
+    # Send prediction results in page order
+    request_ids = []
+    for n, (request_id, answer) in enumerate(results, 1):
+        prefix = f"Страница {n}. " if len(pages) > 1 else ""
+        if answer is None:
+            if len(pages) > 1:
+                await bot.send_message(message.from_user.id, prefix + "Что-то пошло не так")
+            continue
+        request_ids.append(request_id)
+        await bot.send_message(
+            message.from_user.id,
+            prefix + f"Ответ модели: {answer['prediction']}, уверенность {answer['confidence']*100:.2f}%"
+        )
+
+    if request_ids:
+        # Store request_ids for this user, kept in FSM storage
+        await state.update_data(request_ids=request_ids)
+        await bot.send_message(
+            message.from_user.id,
+            "Оцените качество распознавания:",
+            reply_markup=get_rating_keyboard()
+        )
+        # Set state to waiting for rating
+        await state.set_state(UserStates.waiting_for_rating)
+    else:
+        await bot.send_message(message.from_user.id, "Что-то пошло не так")
+        await state.set_state(UserStates.waiting_for_photo)
 
 @router.callback_query(lambda c: c.data.startswith('rate_'))
 async def process_rating(callback_query: types.CallbackQuery, bot: Bot, state: FSMContext):
@@ -114,7 +228,6 @@ async def process_rating(callback_query: types.CallbackQuery, bot: Bot, state: F
         logger.debug("Not in rating state, ignoring callback")
         return
 
-    user_id = callback_query.from_user.id
     rating_data = callback_query.data
     logger.debug(f"Rating data: {rating_data}")
     
@@ -128,26 +241,20 @@ async def process_rating(callback_query: types.CallbackQuery, bot: Bot, state: F
         return
     
     rating = int(rating_data.split('_')[1])
-    request_id = user_requests.get(user_id)
-    logger.debug(f"Rating: {rating}, Request ID: {request_id}")
+    request_ids = (await state.get_data()).get('request_ids')
+    logger.debug(f"Rating: {rating}, Request IDs: {request_ids}")
     
-    if request_id:
-        # Send rating to backend
-        url = f'http://{BACKEND_HOST}:{BACKEND_PORT}/rate'
-        data = {
-            'request_id': request_id,
-            'rating': rating
-        }
-        response = requests.post(url, json=data)
+    if request_ids:
+        # Send rating to backend, an album is rated as a whole
+        responses = await asyncio.gather(*[backend.rate(request_id, rating) for request_id in request_ids])
+        status = next((status for status, _ in responses if status != 200), 200)
         
-        if response.status_code == 200:
-            if rating <= 3:
+        if status == 200:
+            # a single transcription can only be matched to a single page
+            if rating <= 3 and len(request_ids) == 1:
                 logger.debug("Setting transcription state")
                 await state.set_state(UserStates.waiting_for_transcription)
-                user_requests[user_id] = {
-                    'request_id': request_id,
-                    'rating': rating
-                }
+                await state.update_data(rating=rating)
                 await callback_query.message.edit_text(
                     callback_query.message.text + f"\n\nСпасибо за оценку: {rating} ⭐\n"
                     "Пожалуйста, напишите правильный текст, который должен был быть распознан:"
@@ -157,48 +264,42 @@ async def process_rating(callback_query: types.CallbackQuery, bot: Bot, state: F
                 await callback_query.message.edit_text(
                     callback_query.message.text + f"\n\nСпасибо за оценку: {rating} ⭐"
                 )
-                user_requests.pop(user_id, None)
+                await state.set_data({})
                 await state.set_state(UserStates.waiting_for_photo)
         else:
-            logger.error(f"Failed to save rating. Status code: {response.status_code}")
+            logger.error(f"Failed to save rating. Status code: {status}")
             await callback_query.message.edit_text(
                 callback_query.message.text + "\n\nНе удалось сохранить оценку"
             )
-            user_requests.pop(user_id, None)
+            await state.set_data({})
             await state.set_state(UserStates.waiting_for_photo)
     
     await callback_query.answer()
 
 @router.message(UserStates.waiting_for_transcription)
 async def process_transcription(message: Message, bot: Bot, state: FSMContext):
-    user_id = message.from_user.id
     current_state = await state.get_state()
     logger.debug(f"Processing transcription. Current state: {current_state}")
     
-    user_data = user_requests.get(user_id)
+    user_data = await state.get_data()
     logger.debug(f"User data: {user_data}")
     
-    if user_data:
-        request_id = user_data['request_id']
+    if user_data.get('request_ids'):
+        request_id = user_data['request_ids'][0]
         transcription = message.text
         
         # Send transcription to backend
-        url = f'http://{BACKEND_HOST}:{BACKEND_PORT}/transcribe'
-        data = {
-            'request_id': request_id,
-            'transcription': transcription
-        }
-        response = requests.post(url, json=data)
+        status, _ = await backend.transcribe(request_id, transcription)
         
-        if response.status_code == 200:
+        if status == 200:
             logger.debug("Transcription saved successfully")
             await message.answer("Спасибо за предоставление правильного текста!")
         else:
-            logger.error(f"Failed to save transcription. Status code: {response.status_code}")
+            logger.error(f"Failed to save transcription. Status code: {status}")
             await message.answer("Не удалось сохранить правильный текст")
         
         # Clean up
-        user_requests.pop(user_id, None)
+        await state.set_data({})
         await state.set_state(UserStates.waiting_for_photo)
         
         # Send a new message to indicate the process is complete
@@ -2,10 +2,13 @@ import asyncio
 import logging
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from keyboards.menu import default_commands
 from handlers import handler
+from services.albums import albums
+from services.backend import backend
+from services.history import TrackSentMessages, history, track_received_messages
+from services.storage import create_storage
 import os
 
 from dotenv import load_dotenv
@@ -15,13 +18,19 @@ load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 bot = Bot(token=os.getenv("TOKEN"))
+bot.session.middleware(TrackSentMessages(history))
 
 
-storage = MemoryStorage()
+storage = create_storage()
 dp = Dispatcher(storage=storage)
+history.bind(storage)
+albums.bind(storage)
+dp.message.outer_middleware(track_received_messages)
 dp.include_router(handler.router)
 
 dp.startup.register(default_commands)
+dp.startup.register(backend.start)
+dp.shutdown.register(backend.close)
 dp.run_polling(bot)
 
 
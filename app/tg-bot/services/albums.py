@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.redis import RedisStorage
+
+
+ALBUM_WAIT = 1.0  # seconds to wait for the rest of an album after its first photo
+ALBUM_TTL = 60  # seconds, pages of an album whose collector died are dropped after it
+
+
+class AlbumCollector:
+    """Pages of albums being collected.
+
+    Every page of an album arrives as a separate update, possibly at another
+    replica. Pages are kept in redis next to FSM state when the bot uses
+    RedisStorage, so the replica that got the first page sees them all,
+    in process otherwise.
+    """
+
+    def __init__(self):
+        self.redis = None
+        self.albums = {}  # media_group_id -> pages
+
+    def bind(self, storage: BaseStorage):
+        if isinstance(storage, RedisStorage):
+            self.redis = storage.redis
+
+    async def add(self, media_group_id: str, page: dict) -> bool:
+        """Add a page, True if it is the first page of its album and the caller collects it"""
+        if self.redis is not None:
+            key = f"album:{media_group_id}"
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.rpush(key, json.dumps(page))
+                pipe.expire(key, ALBUM_TTL)
+                count, _ = await pipe.execute()
+            return count == 1
+
+        album = self.albums.setdefault(media_group_id, [])
+        album.append(page)
+        return len(album) == 1
+
+    async def collect(self, media_group_id: str) -> list[dict]:
+        """Wait for the rest of an album and take its pages, in the order they were sent"""
+        await asyncio.sleep(ALBUM_WAIT)
+        if self.redis is not None:
+            key = f"album:{media_group_id}"
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.lrange(key, 0, -1)
+                pipe.delete(key)
+                pages, _ = await pipe.execute()
+            pages = [json.loads(page) for page in pages]
+        else:
+            pages = self.albums.pop(media_group_id, [])
+        return sorted(pages, key=lambda page: page["message_id"])
+
+# Create a global instance
+albums = AlbumCollector()
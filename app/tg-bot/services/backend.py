@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+
+
+BACKEND_HOST = "backend"
+BACKEND_PORT = "5000"
+
+# Connection settings
+POOL_SIZE = 100  # simultaneous connections to the backend
+KEEPALIVE_TIMEOUT = 30  # seconds an idle connection is kept open
+CONNECT_TIMEOUT = 5  # seconds
+REQUEST_TIMEOUT = 60  # seconds, OCR of a large page can take a while
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.5  # seconds, doubled on every attempt
+# the backend sheds load with these before doing any work, any request can be sent again
+RETRY_STATUSES = {429, 503}
+# a gateway error can come after the backend started the work, only requests that can be repeated are retried
+IDEMPOTENT_RETRY_STATUSES = {502, 504}
+# failures before the request reached the backend
+CONNECTION_ERRORS = (aiohttp.ClientConnectorError, aiohttp.ServerDisconnectedError)
+MAX_RETRY_AFTER = 10  # seconds, longest Retry-After the backend is trusted with
+
+logger = logging.getLogger("TG-BOT-BACKEND")
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header, given as seconds or as an HTTP date, 0 if missing or invalid"""
+    if not value:
+        return 0
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return 0
+    return min(max(seconds, 0), MAX_RETRY_AFTER)
+
+
+class BackendClient:
+    """Shared keep-alive session for calls to the backend API."""
+
+    def __init__(self):
+        self.session = None
+
+    async def start(self):
+        """Create the session, registered on dispatcher startup."""
+        if not self.session:
+            self.session = aiohttp.ClientSession(
+                base_url=f"http://{BACKEND_HOST}:{BACKEND_PORT}",
+                connector=aiohttp.TCPConnector(limit=POOL_SIZE, keepalive_timeout=KEEPALIVE_TIMEOUT),
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+            )
+            logger.info("Backend session started")
+
+    async def close(self):
+        """Close the session, registered on dispatcher shutdown."""
+        if self.session:
+            await self.session.close()
+            self.session = None
+            logger.info("Backend session closed")
+
+    async def _post(self, path, make_body, read=None, idempotent=False):
+        """POST with retries on network errors and overload statuses.
+
+        A request that may have reached the backend is only sent again if it is
+        idempotent, a repeated prediction would run and be stored twice.
+
+        Args:
+            path: Endpoint path
+            make_body: Callable returning request kwargs, called per attempt since form data is single-use
+            read: Optional coroutine function reading the payload of a 200 response, json by default
+            idempotent: Retry also on gateway errors and timeouts
+
+        Returns:
+            tuple: status code and payload, (None, None) if the backend is unreachable
+        """
+        retry_statuses = RETRY_STATUSES | IDEMPOTENT_RETRY_STATUSES if idempotent else RETRY_STATUSES
+        retry_errors = (aiohttp.ClientError, asyncio.TimeoutError) if idempotent else CONNECTION_ERRORS
+        for attempt in range(MAX_RETRIES + 1):
+            retry_after = 0
+            answered = False
+            try:
+                async with self.session.post(path, **make_body()) as response:
+                    answered = True
+                    if response.status not in retry_statuses or attempt == MAX_RETRIES:
+                        payload = None
+                        if response.status == 200:
+                            payload = await (read or aiohttp.ClientResponse.json)(response)
+                        return response.status, payload
+                    logger.warning(f"{path} answered {response.status}, attempt {attempt + 1}")
+                    # the backend estimates when it has a free slot when it sheds load
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # an error while reading the answer comes after the work was done
+                if not isinstance(e, retry_errors) or (answered and not idempotent):
+                    logger.error(f"{path} failed: {e!r}")
+                    return None, None
+                if attempt == MAX_RETRIES:
+                    logger.error(f"{path} is unreachable: {e!r}")
+                    return None, None
+                logger.warning(f"{path} failed: {e!r}, attempt {attempt + 1}")
+
+            # exponential backoff with full jitter
+            await asyncio.sleep(retry_after + random.uniform(0, RETRY_BASE_DELAY * 2 ** attempt))
+
+    async def predict_stream(
+        self, user_id, request_id, open_image, on_event, filename="image.jpg", content_type="image/jpeg"
+    ):
+        """Upload an image for recognition and follow its partial results.
+
+        Args:
+            user_id: Telegram user id
+            request_id: Id to rate the prediction with later
+            open_image: Callable returning the image as bytes or as an async iterator of chunks,
+                called again on every retry since a stream can only be sent once
+            filename: Name of the uploaded file
+            content_type: Mime type of the image
+            on_event: Coroutine function awaited with every "detections" and "words" event,
+                events can repeat if the request is retried
+
+        Returns:
+            tuple: status code and the final "result" event, its status is "error" if recognition failed
+        """
+        def make_body():
+            form = aiohttp.FormData()
+            form.add_field("user_id", str(user_id))
+            form.add_field("request_id", request_id)
+            # async iterators are sent with chunked transfer encoding as they are read
+            form.add_field("file", open_image(), filename=filename, content_type=content_type)
+            return {"data": form}
+
+        async def read(response):
+            # NDJSON, one event per line
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if event["event"] == "result":
+                    return event
+                await on_event(event)
+            return None
+        return await self._post("/predict_stream", make_body, read=read)
+
+    async def rate(self, request_id, rating):
+        return await self._post(
+            "/rate", lambda: {"json": {"request_id": request_id, "rating": rating}}, idempotent=True
+        )
+
+    async def transcribe(self, request_id, transcription):
+        return await self._post(
+            "/transcribe", lambda: {"json": {"request_id": request_id, "transcription": transcription}},
+            idempotent=True,
+        )
+
+# Create a global backend client instance
+backend = BackendClient()
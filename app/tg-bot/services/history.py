@@ -0,0 +1,138 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.redis import RedisStorage
+from aiogram.types import Message
+
+
+# Telegram only lets bots delete messages younger than 48 hours
+HISTORY_TTL = 48 * 60 * 60  # seconds
+HISTORY_MAX_CHATS = 10000  # chats kept in process, least recently active ones are dropped first
+
+# deleteMessages limits
+DELETE_BATCH_SIZE = 100  # message ids per call
+DELETE_RATE = 20  # calls per second
+DELETE_BURST = 5
+
+
+class MessageHistory:
+    """Ids of messages that exist in a chat, for /clear.
+
+    Kept in redis next to FSM state when the bot uses RedisStorage,
+    so every replica sees the same history, in process otherwise, where
+    messages expire after HISTORY_TTL and at most HISTORY_MAX_CHATS chats are kept.
+    """
+
+    def __init__(self):
+        self.redis = None
+        self.chats = OrderedDict()  # chat_id -> {message_id: sent_at}, least recently active first
+
+    def bind(self, storage: BaseStorage):
+        if isinstance(storage, RedisStorage):
+            self.redis = storage.redis
+
+    async def add(self, chat_id: int, message_id: int):
+        now = time.time()
+        if self.redis is not None:
+            key = f"history:{chat_id}"
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zadd(key, {message_id: now})
+                pipe.zremrangebyscore(key, 0, now - HISTORY_TTL)
+                pipe.expire(key, HISTORY_TTL)
+                await pipe.execute()
+        else:
+            self._add_local(chat_id, message_id, now)
+
+    def _add_local(self, chat_id: int, message_id: int, now: float):
+        since = now - HISTORY_TTL
+        messages = self.chats.setdefault(chat_id, {})
+        self.chats.move_to_end(chat_id)
+        # messages are in the order they were added, expired ones are at the front
+        while messages and next(iter(messages.values())) < since:
+            del messages[next(iter(messages))]
+        messages[message_id] = now
+
+        # chats without a message for HISTORY_TTL have nothing left to delete
+        while self.chats:
+            least_recent = next(iter(self.chats.values()))
+            if len(self.chats) <= HISTORY_MAX_CHATS and next(reversed(least_recent.values())) >= since:
+                break
+            self.chats.popitem(last=False)
+
+    async def get_all(self, chat_id: int) -> list[int]:
+        """Ids of messages that can still be deleted, newest first"""
+        since = time.time() - HISTORY_TTL
+        if self.redis is not None:
+            message_ids = await self.redis.zrevrangebyscore(f"history:{chat_id}", "+inf", since)
+            return [int(message_id) for message_id in message_ids]
+
+        messages = self.chats.get(chat_id, {})
+        return sorted((i for i, sent_at in messages.items() if sent_at >= since), reverse=True)
+
+    async def remove(self, chat_id: int, message_ids: list[int]):
+        """Forget messages once they are deleted"""
+        if not message_ids:
+            return
+        if self.redis is not None:
+            await self.redis.zrem(f"history:{chat_id}", *message_ids)
+            return
+
+        messages = self.chats.get(chat_id)
+        if messages is None:
+            return
+        for message_id in message_ids:
+            messages.pop(message_id, None)
+        if not messages:
+            del self.chats[chat_id]
+
+
+class TrackSentMessages(BaseRequestMiddleware):
+    """Bot session middleware recording every message the bot sends"""
+
+    def __init__(self, history: MessageHistory):
+        self.history = history
+
+    async def __call__(self, make_request, bot: Bot, method):
+        response = await make_request(bot, method)
+        result = response.result
+        messages = result if isinstance(result, list) else [result]
+        for message in messages:
+            if isinstance(message, Message):
+                await self.history.add(message.chat.id, message.message_id)
+        return response
+
+
+async def track_received_messages(handler, event: Message, data):
+    """Dispatcher outer middleware recording every message users send"""
+    await history.add(event.chat.id, event.message_id)
+    return await handler(event, data)
+
+
+class TokenBucket:
+    """Async token bucket limiting the rate of Telegram API calls"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# Create global instances
+history = MessageHistory()
+delete_limiter = TokenBucket(DELETE_RATE, DELETE_BURST)
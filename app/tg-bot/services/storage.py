@@ -0,0 +1,31 @@
+import logging
+import os
+
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisStorage
+
+
+# "redis://host:port/db" for a shared store, "fakeredis://" for an in-process
+# redis stand-in in tests (fakeredis is in requirements-test.txt), "memory://" for plain MemoryStorage
+STORAGE_URL = os.getenv("STORAGE_URL", "memory://")
+STATE_TTL = int(os.getenv("STATE_TTL", 24 * 60 * 60))  # seconds, abandoned prompts expire after it
+
+logger = logging.getLogger("TG-BOT-STORAGE")
+
+
+def create_storage(url: str = STORAGE_URL) -> BaseStorage:
+    """Create FSM storage, FSM data also keeps the request_id of the prediction being rated"""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        storage = RedisStorage.from_url(url, state_ttl=STATE_TTL, data_ttl=STATE_TTL)
+    elif url == "fakeredis://":
+        from fakeredis.aioredis import FakeRedis
+        storage = RedisStorage(FakeRedis(), state_ttl=STATE_TTL, data_ttl=STATE_TTL)
+    elif url == "memory://":
+        # no expiry and not shared between replicas, for local runs only
+        storage = MemoryStorage()
+    else:
+        raise ValueError(f"Unsupported STORAGE_URL: {url}")
+
+    logger.info(f"Using {type(storage).__name__} for FSM state")
+    return storage
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the bot modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# redis-backed code paths run against an in-process fake redis
+os.environ.setdefault("STORAGE_URL", "fakeredis://")
@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import DeleteMessages
+from handlers import handler
+from services.history import MessageHistory
+from services.storage import create_storage
+
+
+class FakeBot:
+    """Bot whose deleteMessages calls fail as scripted, recording the batches it got"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.batches = []
+
+    async def delete_messages(self, chat_id, message_ids):
+        self.batches.append(list(message_ids))
+        error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            raise error
+
+class FakeState:
+    async def set_state(self, state):
+        self.state = state
+
+def retry_after(seconds):
+    return TelegramRetryAfter(DeleteMessages(chat_id=10, message_ids=[1]), "Flood control exceeded", seconds)
+
+@pytest.fixture
+def history(monkeypatch):
+    storage = create_storage()
+    asyncio.run(storage.redis.flushall())
+    history = MessageHistory()
+    history.bind(storage)
+    monkeypatch.setattr(handler, "history", history)
+    monkeypatch.setattr(handler, "DELETE_BATCH_SIZE", 2)
+    return history
+
+def clear(bot, history, message_ids):
+    message = SimpleNamespace(chat=SimpleNamespace(id=10))
+
+    async def run():
+        for message_id in message_ids:
+            await history.add(10, message_id)
+        await handler.all_clear(message, bot, FakeState())
+        return await history.get_all(10)
+
+    return asyncio.run(run())
+
+def test_flood_control_retries_the_batch(history):
+    bot = FakeBot(None, retry_after(0))
+
+    assert clear(bot, history, [1, 2, 3, 4, 5]) == []
+    assert bot.batches == [[5, 4], [3, 2], [3, 2], [1]]
+
+def test_failed_batches_stay_in_history(history):
+    bot = FakeBot(None, ConnectionError("network is down"))
+
+    with pytest.raises(ConnectionError):
+        clear(bot, history, [1, 2, 3, 4, 5])
+    # a repeated /clear deletes what is left
+    assert asyncio.run(history.get_all(10)) == [3, 2, 1]
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+from services import albums as albums_module
+from services.albums import AlbumCollector
+from services.history import MessageHistory
+from services.storage import create_storage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+@pytest.fixture
+def storage():
+    storage = create_storage()
+    asyncio.run(storage.redis.flushall())
+    return storage
+
+def test_fake_redis_storage(storage):
+    assert isinstance(storage, RedisStorage)
+
+    async def run():
+        await storage.set_state(KEY, "UserStates:waiting_for_rating")
+        await storage.set_data(KEY, {"request_id": "abc"})
+        return await storage.get_state(KEY), await storage.get_data(KEY)
+
+    assert asyncio.run(run()) == ("UserStates:waiting_for_rating", {"request_id": "abc"})
+
+def test_history_in_redis(storage):
+    history = MessageHistory()
+    history.bind(storage)
+
+    async def run():
+        for message_id in (1, 2, 3):
+            await history.add(10, message_id)
+        await history.add(20, 4)
+        newest_first = await history.get_all(10)
+        await history.remove(10, [3, 1])
+        return newest_first, await history.get_all(10), await history.get_all(20)
+
+    assert asyncio.run(run()) == ([3, 2, 1], [2], [4])
+
+def test_album_pages_in_redis(storage, monkeypatch):
+    monkeypatch.setattr(albums_module, "ALBUM_WAIT", 0)
+    albums = AlbumCollector()
+    albums.bind(storage)
+
+    async def run():
+        firsts = [await albums.add("album", {"message_id": i}) for i in (2, 1, 3)]
+        return firsts, await albums.collect("album"), await storage.redis.exists("album:album")
+
+    firsts, pages, left = asyncio.run(run())
+    assert firsts == [True, False, False]
+    assert [page["message_id"] for page in pages] == [1, 2, 3]
+    assert not left